@@ -1,15 +1,20 @@
 # app/api/campaign_api.py
 
-from fastapi import APIRouter, Depends, status, Response, UploadFile, File, BackgroundTasks, Form
+from fastapi import APIRouter, Depends, status, Response, UploadFile, BackgroundTasks, Form, WebSocket, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from beanie import PydanticObjectId
-from typing import List
+from typing import List, Optional
 
-from app.schemas.campaign_schema import CampaignCreate, CampaignDisplay
-from app.services import campaign_service
+from app.schemas.campaign_schema import CampaignCreate, CampaignDisplay, CampaignSummary, RecipientPage
+from app.schemas.certificate_schema import OutputFormatBenchmark
+from app.schemas.import_job_schema import ImportJobDisplay
+from app.services import campaign_service, certificate_service, import_service, preview_service, recipient_service, upload_service
+from app.core.responses import model_response
 from app.core.security import get_current_user
 from app.models.user_model import User
+from app.models.campaign_model import Campaign
 
-router = APIRouter()
+router = APIRouter(route_class=upload_service.UploadLimitRoute)
 
 @router.post(
     "/",
@@ -39,11 +44,26 @@ async def create_new_campaign(
     response_model=List[CampaignDisplay],
     summary="Get all campaigns for the current user"
 )
-async def get_all_campaigns(current_user: User = Depends(get_current_user)):
+async def get_all_campaigns(
+    cursor: Optional[str] = Query(None, description="Valor de la cabecera X-Next-Cursor de la página anterior"),
+    limit: Optional[int] = Query(None, ge=1, le=200, description="Campañas por página (paginación opcional)"),
+    current_user: User = Depends(get_current_user)
+):
     """
-    Endpoint para listar todas las campañas del usuario autenticado.
+    Endpoint para listar las campañas del usuario autenticado, de la más
+    recientemente modificada a la más antigua.
+
+    Sin 'limit' ni 'cursor' devuelve todas las campañas, como hasta ahora.
+    Con 'limit' (o 'cursor') se pagina: si hay más campañas, la respuesta
+    incluye la cabecera X-Next-Cursor, que se envía como 'cursor' para pedir
+    la siguiente página.
     """
-    return await campaign_service.get_campaigns_by_user(current_user)
+    if cursor and limit is None:
+        limit = campaign_service.CAMPAIGN_PAGE_SIZE
+    campaigns, next_cursor = await campaign_service.get_campaigns_by_user(current_user, cursor, limit)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    # Las campañas ya vienen validadas de la proyección: se serializan sin revalidar
+    return model_response(List[CampaignSummary], campaigns, headers=headers)
 
 
 @router.get(
@@ -60,6 +80,130 @@ async def get_one_campaign(
     """
     return await campaign_service.get_campaign_by_id(campaign_id, current_user)
 
+@router.get(
+    "/{campaign_id}/certificates.zip",
+    summary="Download all certificates of a campaign as a ZIP",
+    response_class=StreamingResponse
+)
+async def download_campaign_certificates(
+    campaign_id: PydanticObjectId,
+    current_user: User = Depends(get_current_user)
+) -> StreamingResponse:
+    """
+    Endpoint para descargar todos los certificados de una campaña en un único ZIP.
+
+    Reutiliza los certificados ya generados y renderiza el resto en paralelo.
+    El ZIP se envía a medida que se generan las entradas, así que la descarga
+    empieza de inmediato incluso con miles de destinatarios.
+    """
+    campaign = await campaign_service.get_campaign_by_id(campaign_id, current_user)
+    return await certificate_service.stream_campaign_certificates_zip(campaign)
+
+@router.get(
+    "/{campaign_id}/recipients",
+    response_model=RecipientPage,
+    summary="List the recipients of a campaign, paginated"
+)
+async def list_campaign_recipients(
+    campaign_id: PydanticObjectId,
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en 'next_cursor' por la página anterior"),
+    limit: int = Query(50, ge=1, le=200),
+    email_status: Optional[str] = Query(None, description="PENDING, SENT o FAILED"),
+    claimed: Optional[bool] = Query(None, description="true: certificado reclamado; false: sin reclamar"),
+    search: Optional[str] = Query(None, min_length=1, description="Prefijo del nombre o del correo"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Endpoint para listar los destinatarios de una campaña con paginación por
+    cursor. Para pedir la siguiente página se envía el 'next_cursor' recibido
+    (con los mismos filtros); es null en la última página.
+
+    Con filtros, una página puede traer menos de 'limit' destinatarios (o
+    ninguno) y aun así tener 'next_cursor': cada página examina un tramo
+    acotado de la campaña. Se sigue pidiendo hasta que 'next_cursor' es null.
+    """
+    page = await recipient_service.list_recipients(
+        campaign_id=campaign_id,
+        current_user=current_user,
+        cursor=cursor,
+        limit=limit,
+        email_status=email_status,
+        claimed=claimed,
+        search=search
+    )
+    return model_response(RecipientPage, page)
+
+@router.get(
+    "/{campaign_id}/stats",
+    response_model=Campaign.StatsCounters,
+    summary="Get sent, failed, pending and claimed counts for a campaign"
+)
+async def get_campaign_stats(
+    campaign_id: PydanticObjectId,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Endpoint para obtener los contadores de una campaña (total, pendientes,
+    enviados, fallidos y reclamados) sin descargar los destinatarios.
+    """
+    return await recipient_service.get_campaign_stats(campaign_id, current_user)
+
+@router.get(
+    "/{campaign_id}/recipients/export",
+    summary="Export the recipients and their delivery status as CSV or XLSX"
+)
+async def export_campaign_recipients(
+    campaign_id: PydanticObjectId,
+    format: str = Query("csv", description="csv o xlsx"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Endpoint para descargar el listado final de destinatarios: nombre, correo,
+    código, estado del email, URL del certificado y fecha de reclamación.
+    """
+    return await recipient_service.export_recipients(campaign_id, current_user, format)
+
+@router.get(
+    "/{campaign_id}/output-benchmark",
+    response_model=List[OutputFormatBenchmark],
+    summary="Benchmark certificate output formats on the campaign template"
+)
+async def benchmark_campaign_output_formats(
+    campaign_id: PydanticObjectId,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Endpoint para comparar los formatos de salida (PNG con distintos niveles de
+    compresión, JPEG, WEBP con y sin pérdida, PDF) sobre la plantilla real de la
+    campaña. Devuelve el tiempo de codificación y el tamaño de cada uno.
+    """
+    campaign = await campaign_service.get_campaign_by_id(campaign_id, current_user)
+    return await certificate_service.benchmark_output_formats(campaign)
+
+@router.websocket("/{campaign_id}/preview")
+async def preview_campaign_template(
+    websocket: WebSocket,
+    campaign_id: PydanticObjectId,
+    token: str
+):
+    """
+    WebSocket de previsualización en vivo para el editor de plantillas.
+
+    El token de acceso se envía como parámetro de consulta (?token=...), ya que
+    los navegadores no permiten cabeceras personalizadas en WebSockets.
+    El cliente envía JSON con los parámetros modificados y recibe cada frame
+    como JPEG. {"action": "save"} guarda la configuración sin subir la plantilla.
+    """
+    try:
+        current_user = await get_current_user(token)
+        campaign = await campaign_service.get_campaign_by_id(campaign_id, current_user)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    await preview_service.run_preview_session(websocket, campaign)
+
 @router.patch(
     "/{campaign_id}/name",
     response_model=CampaignDisplay,
@@ -91,79 +235,96 @@ async def update_campaign_config(
     campaign_id: PydanticObjectId,
     current_user: User = Depends(get_current_user),
     # Archivos
-    template_image: UploadFile = File(...),
-    recipients_file: UploadFile = File(None),
-    # Configuración (todos requeridos)
-    name_pos_x: int = Form(...),
-    name_pos_y: int = Form(...),
-    name_font_size: int = Form(...),
-    name_color: str = Form(...),
-    typography_id: str = Form(...),
+    template_image: UploadFile = upload_service.upload_file("template", None),
+    recipients_file: UploadFile = upload_service.upload_file("recipients", None),
+    # Configuración
+    name_pos_x: int = Form(None),
+    name_pos_y: int = Form(None),
+    name_font_size: int = Form(None),
+    name_color: str = Form(None),
+    typography_id: str = Form(None),
     code_pos_x: int = Form(None),
     code_pos_y: int = Form(None),
     code_font_size: int = Form(None),
     code_color: str = Form(None),
-    # Email (todos requeridos)
-    email_subject: str = Form(...),
-    email_body: str = Form(...)
+    text_fields: str = Form(None),
+    # Email
+    email_subject: str = Form(None),
+    email_body: str = Form(None),
+    # Salida
+    output_format: str = Form(None),
+    png_compress_level: int = Form(None),
+    jpeg_quality: int = Form(None),
+    webp_quality: int = Form(None),
+    webp_lossless: bool = Form(None)
 ):
     """
     Endpoint para actualizar configuración, email, plantilla y destinatarios de una campaña.
     
-    Usa las funciones existentes del servicio para manejar cada parte.
+    Es una actualización parcial: todos los campos son opcionales y solo se
+    modifica lo que se envía. Si la plantilla o el Excel enviados son idénticos
+    a los actuales, no se vuelven a subir ni a procesar.
     
-    Campos requeridos (FormData):
+    Campos (FormData):
     
     **Archivos:**
-    - template_image: Imagen de plantilla del certificado (archivo, requerido)
-    - recipients_file: Archivo Excel con destinatarios (archivo, opcional)
+    - template_image: Imagen de plantilla del certificado (archivo, opcional)
+    - recipients_file: Archivo Excel con destinatarios (archivo, opcional). Para
+      Excel muy grandes, usar POST /campaigns/{campaign_id}/imports.
     
     **Configuración del certificado:**
-    - name_pos_x: Posición X del nombre (int, requerido)
-    - name_pos_y: Posición Y del nombre (int, requerido)
-    - name_font_size: Tamaño de fuente del nombre (int, requerido)
-    - name_color: Color del nombre (string, requerido)
-    - typography_id: ID de la tipografía (string, requerido)
+    - name_pos_x: Posición X del nombre (int, opcional)
+    - name_pos_y: Posición Y del nombre (int, opcional)
+    - name_font_size: Tamaño de fuente del nombre (int, opcional)
+    - name_color: Color del nombre (string, opcional)
+    - typography_id: ID de la tipografía (string, opcional)
     - code_pos_x: Posición X del código (int, opcional)
     - code_pos_y: Posición Y del código (int, opcional)
     - code_font_size: Tamaño de fuente del código (int, opcional)
     - code_color: Color del código (string, opcional)
+    - text_fields: Lista JSON de campos de texto (string, opcional). Cada campo tiene
+      source (columna del Excel, 'name' o 'unique_code'), pos_x, pos_y, font_size,
+      color, align, anchor, max_width, auto_shrink y min_font_size. Si se envía,
+      sustituye a los campos name_* y code_* al dibujar.
     
     **Email:**
-    - email_subject: Asunto del email (string, requerido)
-    - email_body: Cuerpo del email (string, requerido)
+    - email_subject: Asunto del email (string, opcional)
+    - email_body: Cuerpo del email (string, opcional)
+
+    **Salida:**
+    - output_format: Formato del certificado: PNG, JPEG, WEBP o PDF (string, opcional)
+    - png_compress_level: Nivel de compresión PNG, 0-9 (int, opcional)
+    - jpeg_quality: Calidad JPEG, 1-95 (int, opcional)
+    - webp_quality: Calidad WEBP con pérdida, 1-100 (int, opcional)
+    - webp_lossless: WEBP sin pérdida (bool, opcional)
     """
-    # 1. Subir plantilla y actualizar configuración usando función existente
-    campaign = await campaign_service.upload_template_and_update_config_formdata(
+    return await campaign_service.update_campaign_formdata(
         campaign_id=campaign_id,
-        file=template_image,
-        name_pos_x=name_pos_x,
-        name_pos_y=name_pos_y,
-        name_font_size=name_font_size,
-        name_color=name_color,
-        typography_id=typography_id,
-        code_pos_x=code_pos_x,
-        code_pos_y=code_pos_y,
-        code_font_size=code_font_size,
-        code_color=code_color,
-        current_user=current_user
+        current_user=current_user,
+        template_file=template_image,
+        recipients_file=recipients_file,
+        config_updates={
+            "name_pos_x": name_pos_x,
+            "name_pos_y": name_pos_y,
+            "name_font_size": name_font_size,
+            "name_color": name_color,
+            "typography_id": typography_id,
+            "code_pos_x": code_pos_x,
+            "code_pos_y": code_pos_y,
+            "code_font_size": code_font_size,
+            "code_color": code_color,
+        },
+        text_fields=text_fields,
+        email_subject=email_subject,
+        email_body=email_body,
+        output_updates={
+            "output_format": output_format,
+            "png_compress_level": png_compress_level,
+            "jpeg_quality": jpeg_quality,
+            "webp_quality": webp_quality,
+            "webp_lossless": webp_lossless,
+        }
     )
-    
-    # 2. Actualizar email
-    from app.models.campaign_model import Campaign
-    email_settings = Campaign.EmailSettings(subject=email_subject, body=email_body)
-    campaign.email = email_settings
-    await campaign.save()
-    
-    # 3. Procesar archivo de destinatarios si se proporciona usando función existente
-    if recipients_file is not None:
-        campaign = await campaign_service.process_recipients_file(
-            campaign_id=campaign_id,
-            file=recipients_file,
-            current_user=current_user
-        )
-    
-    return campaign
 
 @router.delete(
     "/{campaign_id}",
@@ -182,6 +343,48 @@ async def delete_one_campaign(
     # Devolvemos una respuesta sin contenido, que es el estándar para DELETE exitosos.
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
+@router.post(
+    "/{campaign_id}/imports",
+    response_model=ImportJobDisplay,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Import recipients from an Excel file in the background"
+)
+async def start_recipients_import(
+    campaign_id: PydanticObjectId,
+    background_tasks: BackgroundTasks,
+    response: Response,
+    recipients_file: UploadFile = upload_service.upload_file("recipients"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Endpoint para importar destinatarios en segundo plano.
+
+    La respuesta es inmediata e incluye el trabajo de importación; el Excel
+    se procesa después. El progreso y el informe final (filas importadas y
+    descartadas) se consultan en la URL de la cabecera Location.
+    """
+    campaign = await import_service.get_import_campaign(campaign_id, current_user)
+    job = await import_service.start_import_job(campaign, recipients_file, current_user, background_tasks)
+    response.headers["Location"] = f"/campaigns/{campaign_id}/imports/{job.id}"
+    return job
+
+
+@router.get(
+    "/{campaign_id}/imports/{job_id}",
+    response_model=ImportJobDisplay,
+    summary="Get the progress of a recipients import"
+)
+async def get_recipients_import(
+    campaign_id: PydanticObjectId,
+    job_id: PydanticObjectId,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Endpoint para consultar el estado de una importación de destinatarios.
+    """
+    return await import_service.get_import_job(campaign_id, job_id, current_user)
+
+
 @router.post(
     "/{campaign_id}/activate",
     summary="Activate a campaign and start sending emails"
@@ -1,6 +1,6 @@
 # app/api/certificate_api.py
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from fastapi.responses import StreamingResponse
 
 from app.schemas.certificate_schema import CertificateClaimRequest
@@ -13,13 +13,18 @@ router = APIRouter()
     summary="Claim and download a certificate",
     response_class=StreamingResponse
 )
-async def claim_certificate(request_data: CertificateClaimRequest) -> StreamingResponse:
+async def claim_certificate(request_data: CertificateClaimRequest, request: Request) -> StreamingResponse:
     """
     Endpoint público para que un estudiante reclame su certificado.
 
     El estudiante envía su código único y, si es válido, la API
-    genera el certificado y lo devuelve como archivo PNG para descarga directa.
+    genera el certificado y lo devuelve como archivo para descarga directa.
+    El formato es el configurado en la campaña (PNG, JPEG, WEBP o PDF), salvo
+    que la cabecera Accept del cliente no lo admita.
     
     El certificado también se guarda en Cloudinary como respaldo.
     """
-    return await certificate_service.generate_certificate_for_code(request_data.unique_code)
\ No newline at end of file
+    return await certificate_service.generate_certificate_for_code(
+        request_data.unique_code,
+        accept=request.headers.get("accept")
+    )
\ No newline at end of file
@@ -0,0 +1,41 @@
+# app/api/health_api.py
+
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+
+from app.core import database
+from app.core.cache import cache_stats
+from app.core.config import settings
+
+router = APIRouter()
+
+
+@router.get(
+    "/ready",
+    summary="Deep health check (database, pool and caches)"
+)
+async def readiness():
+    """
+    Endpoint de disponibilidad: hace un ping a MongoDB e informa del estado
+    del pool de conexiones y de las cachés del proceso. Responde 503 si la
+    base de datos no responde, para que el balanceador deje de enviar tráfico.
+    """
+    report = {
+        "status": "ok",
+        "database": {"name": settings.DATABASE_NAME},
+        "pool": {
+            **database.pool_stats.snapshot(),
+            "max_size": settings.MONGO_MAX_POOL_SIZE,
+            "min_size": settings.MONGO_MIN_POOL_SIZE,
+        },
+        "caches": cache_stats(),
+    }
+    try:
+        report["database"]["ping_ms"] = round(await database.ping_db(), 2)
+    except Exception as e:
+        # El detalle (topología, hosts) solo va al log
+        print(f"Health check: la base de datos no responde: {e}")
+        report["status"] = "unavailable"
+        report["database"]["error"] = type(e).__name__
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=report)
+    return report
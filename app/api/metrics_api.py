@@ -0,0 +1,22 @@
+# app/api/metrics_api.py
+
+from fastapi import APIRouter, Response
+
+from app.core.metrics import render_latest
+
+router = APIRouter()
+
+
+@router.get(
+    "/metrics",
+    summary="Prometheus metrics",
+    include_in_schema=False
+)
+def read_metrics():
+    """
+    Endpoint de métricas en formato Prometheus (latencia por ruta, MongoDB,
+    etapas del render, correos, importaciones y cachés). Con varios workers
+    de gunicorn agrega los valores de todos los procesos.
+    """
+    content, media_type = render_latest()
+    return Response(content=content, media_type=media_type)
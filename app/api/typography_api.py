@@ -5,11 +5,11 @@ from beanie import PydanticObjectId
 from typing import List
 
 from app.schemas.typography_schema import TypographyCreate, TypographyDisplay, TypographyUpdate
-from app.services import typography_service
+from app.services import typography_service, upload_service
 from app.core.security import get_current_user
 from app.models.user_model import User
 
-router = APIRouter()
+router = APIRouter(route_class=upload_service.UploadLimitRoute)
 
 
 @router.post(
@@ -20,7 +20,7 @@ router = APIRouter()
 )
 async def create_new_typography(
     name: str = File(...),
-    file: UploadFile = File(...),
+    file: UploadFile = upload_service.upload_file("font"),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -28,7 +28,7 @@ async def create_new_typography(
     
     Debes enviar:
     - name: Nombre de la tipografía (form-data)
-    - file: Archivo de fuente (.ttf, .otf, .woff, etc.) (form-data)
+    - file: Archivo de fuente .ttf u .otf, máx. 5 MB (form-data)
     
     El archivo se subirá a Cloudinary en la carpeta: certhub-api/typographies
     
@@ -87,7 +87,7 @@ async def update_one_typography(
 )
 async def update_typography_font(
     typography_id: PydanticObjectId,
-    file: UploadFile = File(...),
+    file: UploadFile = upload_service.upload_file("font"),
     current_user: User = Depends(get_current_user)
 ):
     """
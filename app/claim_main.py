@@ -0,0 +1,57 @@
+# app/claim_main.py
+"""
+Aplicación mínima para el endpoint público de reclamación de certificados.
+
+Comparte modelos y servicios con la API completa (app.main), pero solo
+monta la reclamación y las comprobaciones de estado: sin autenticación ni
+gestión de campañas, y sin cargar pandas, openpyxl ni SendGrid. Así los
+workers de reclamación arrancan antes, ocupan menos memoria y se escalan
+por separado:
+
+    gunicorn app.claim_main:app -c gunicorn.conf.py
+
+El proxy envía /certificates/* a estos workers y el resto a app.main.
+"""
+
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+from contextlib import asynccontextmanager
+
+from app.core.database import init_db, close_db
+from app.core.middleware import add_middleware
+from app.api import certificate_api, health_api, metrics_api
+from app.models.campaign_model import Campaign
+from app.models.typography_model import Typography
+
+# Únicos modelos que usa la reclamación
+CLAIM_MODELS = [Campaign, Typography]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    print("Iniciando aplicación de reclamación...")
+    await init_db(CLAIM_MODELS)
+    yield
+    print("Apagando aplicación de reclamación...")
+    await close_db()
+
+
+app = FastAPI(
+    title="Certificate Generator API - Claim",
+    description="Reclamación y descarga de certificados.",
+    version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
+
+add_middleware(app)
+
+app.include_router(certificate_api.router, prefix="/certificates", tags=["Certificates"])
+app.include_router(health_api.router, prefix="/health", tags=["Health Check"])
+app.include_router(metrics_api.router, tags=["Health Check"])
+
+
+@app.get("/", tags=["Health Check"])
+def read_root():
+    """Endpoint de comprobación de estado."""
+    return {"status": "ok"}
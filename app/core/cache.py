@@ -0,0 +1,71 @@
+# app/core/cache.py
+
+from collections import OrderedDict
+from typing import Optional
+import threading
+import weakref
+
+from .metrics import CACHE_REQUESTS
+
+# Cachés con nombre, para poder consultar sus estadísticas (p. ej. en /health/ready)
+_named_caches: "weakref.WeakValueDictionary[str, LRUCache]" = weakref.WeakValueDictionary()
+
+
+class LRUCache:
+    """
+    Caché LRU mínima, segura entre hilos, con contadores de aciertos y fallos.
+    Se usa para los recursos de render que se reutilizan entre peticiones.
+    """
+    def __init__(self, max_size: int, name: Optional[str] = None):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        # Contadores de Prometheus (solo las cachés con nombre)
+        self._hit_counter = CACHE_REQUESTS.labels(name, "hit") if name else None
+        self._miss_counter = CACHE_REQUESTS.labels(name, "miss") if name else None
+        if name:
+            _named_caches[name] = self
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                if self._miss_counter:
+                    self._miss_counter.inc()
+                return None
+            self.hits += 1
+            if self._hit_counter:
+                self._hit_counter.inc()
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "size": len(self),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / requests, 3) if requests else None,
+        }
+
+
+def cache_stats() -> dict[str, dict]:
+    """Estadísticas de todas las cachés con nombre del proceso."""
+    return {name: cache.stats() for name, cache in sorted(_named_caches.items())}
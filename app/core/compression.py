@@ -0,0 +1,128 @@
+# app/core/compression.py
+"""
+Compresión de respuestas: Brotli si el cliente lo acepta y el paquete
+"brotli" está instalado (es opcional), gzip si no.
+
+Solo se comprimen los tipos de texto (JSON, CSV, HTML...) a partir de
+COMPRESSION_MINIMUM_SIZE bytes; las imágenes, los PDF y los ZIP ya van
+comprimidos y se envían tal cual. Las respuestas en streaming (p. ej. la
+exportación a CSV) se comprimen bloque a bloque, sin esperar al final.
+"""
+
+from starlette.datastructures import Headers, MutableHeaders
+import zlib
+
+try:
+    import brotli
+except ImportError:  # Opcional: pip install brotli
+    brotli = None
+
+_COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "application/x-ndjson",
+    "image/svg+xml",
+}
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    if media_type == "text/event-stream":
+        return False
+    return (
+        media_type.startswith("text/")
+        or media_type in _COMPRESSIBLE_TYPES
+        or media_type.endswith(("+json", "+xml"))
+    )
+
+
+class _GzipCompressor:
+    encoding = "gzip"
+
+    def __init__(self, level: int):
+        # wbits=31: formato gzip (cabecera y CRC), no zlib
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        # En streaming cada bloque se vacía para que el cliente lo reciba ya
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class _BrotliCompressor:
+    encoding = "br"
+
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        body = self._compressor.process(data)
+        return body + (self._compressor.finish() if final else self._compressor.flush())
+
+
+class CompressionMiddleware:
+    """Middleware ASGI de compresión (ver la descripción del módulo)."""
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _compressor(self, accept_encoding: str):
+        accepted = {value.split(";", 1)[0].strip() for value in accept_encoding.lower().split(",")}
+        if brotli is not None and "br" in accepted:
+            return lambda: _BrotliCompressor(self.brotli_quality)
+        if "gzip" in accepted:
+            return lambda: _GzipCompressor(self.gzip_level)
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        create_compressor = self._compressor(Headers(scope=scope).get("accept-encoding", ""))
+        if create_compressor is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor
+            if message["type"] == "http.response.start":
+                # Se retiene hasta ver el primer bloque del cuerpo
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                if start_message is not None:
+                    await send(start_message)
+                    start_message = None
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                headers = MutableHeaders(raw=list(start_message["headers"]))
+                if is_compressible(headers.get("content-type", "")):
+                    headers.add_vary_header("Accept-Encoding")
+                    if "content-encoding" not in headers and (more_body or len(body) >= self.minimum_size):
+                        compressor = create_compressor()
+                        headers["Content-Encoding"] = compressor.encoding
+                        del headers["Content-Length"]
+                        body = compressor.compress(body, final=not more_body)
+                        if not more_body:
+                            # Respuesta en un solo bloque: se conoce la longitud final
+                            headers["Content-Length"] = str(len(body))
+                await send({**start_message, "headers": headers.raw})
+                start_message = None
+                await send({**message, "body": body})
+                return
+
+            if compressor:
+                message = {**message, "body": compressor.compress(body, final=not more_body)}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
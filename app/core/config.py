@@ -10,15 +10,37 @@ class Settings(BaseSettings):
     DATABASE_URL: str
     DATABASE_NAME: str
 
+    # MongoDB connection pool (por proceso: multiplicar por el número de workers)
+    MONGO_MAX_POOL_SIZE: int = 50
+    MONGO_MIN_POOL_SIZE: int = 0
+    MONGO_MAX_IDLE_TIME_MS: int = 300_000
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = 5_000       # Espera máxima por una conexión libre
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 5_000
+    MONGO_CONNECT_TIMEOUT_MS: int = 5_000
+    MONGO_SOCKET_TIMEOUT_MS: int = 30_000
+    MONGO_COMPRESSORS: str = ""                    # p. ej. "zstd,snappy,zlib"
+    MONGO_READ_PREFERENCE: str = "primary"         # primary, primaryPreferred, secondaryPreferred...
+    MONGO_REPLY_BYTES_SAMPLE_RATE: float = 0.01    # Fracción de respuestas medidas en bytes (0: no se mide)
+
+    # Lecturas marcadas con @secondary_reads (listados, estadísticas, catálogo)
+    MONGO_SECONDARY_READS: bool = True
+    MONGO_MAX_STALENESS_SECONDS: int = 90          # Mínimo admitido por MongoDB: 90
+
     # JWT settings - NUEVAS LÍNEAS
     SECRET_KEY: str
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
 
+    # Storage settings: "cloudinary" o "local" (sin conexión, para desarrollo y pruebas de carga)
+    STORAGE_BACKEND: str = "cloudinary"
+    STORAGE_MAX_CONCURRENCY: int = 8  # Subidas/borrados simultáneos a Cloudinary
+    LOCAL_STORAGE_PATH: str = "storage"
+    LOCAL_STORAGE_BASE_URL: str = "http://localhost:8000/files"
+
     # Cloudinary settings - AÑADE ESTAS LÍNEAS
-    CLOUDINARY_CLOUD_NAME: str
-    CLOUDINARY_API_KEY: str
-    CLOUDINARY_API_SECRET: str
+    CLOUDINARY_CLOUD_NAME: str = ""
+    CLOUDINARY_API_KEY: str = ""
+    CLOUDINARY_API_SECRET: str = ""
 
     # Email settings
     MAIL_FROM: str
@@ -27,6 +49,17 @@ class Settings(BaseSettings):
     # Frontend URL - AÑADE ESTA LÍNEA
     FRONTEND_URL: str
 
+    # Una línea JSON por petición con su id, duración y spans
+    REQUEST_LOG: bool = True
+
+    # Respuestas de texto (JSON, CSV) más pequeñas que esto se envían sin comprimir
+    COMPRESSION_MINIMUM_SIZE: int = 1024
+
+    # Perfilado bajo demanda (desactivado si no hay token; ver app/core/profiling.py)
+    PROFILE_TOKEN: str = ""
+    PROFILE_DIR: str = "profiles"
+    PROFILE_INTERVAL_MS: int = 5
+
     @field_validator("SENDGRID_API_KEY")
     @classmethod
     def clean_api_key(cls, v):
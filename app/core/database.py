@@ -1,31 +1,162 @@
 # app/core/database.py
 
-import motor.motor_asyncio
+from pymongo import AsyncMongoClient, monitoring
 from beanie import init_beanie
+from typing import Optional
+import asyncio
+import time
 
 # 1. Importa los modelos que acabamos de crear
 from app.models.user_model import User
 from app.models.plan_model import Plan
 from app.models.typography_model import Typography
 from app.models.campaign_model import Campaign
+from app.models.asset_model import Asset
+from app.models.import_job_model import ImportJob
 from .config import settings
+from .indexes import ensure_indexes, verify_indexes
+from .metrics import MongoCommandMetrics
 
-async def init_db():
+# Modelos registrados en Beanie
+DOCUMENT_MODELS = [
+    User,
+    Plan,
+    Typography,
+    Campaign,
+    Asset,
+    ImportJob,
+]
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """
+    Cuenta los eventos del pool de conexiones (por proceso). Los callbacks
+    los llama el driver en cada evento, así que solo suman enteros.
+    """
+    def __init__(self):
+        self.pools = 0
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.checked_in = 0
+        self.checkout_failed = 0
+
+    def pool_created(self, event):
+        self.pools += 1
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        self.pools -= 1
+
+    def connection_created(self, event):
+        self.created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.closed += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self.checkout_failed += 1
+
+    def connection_checked_out(self, event):
+        self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        self.checked_in += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "pools": self.pools,
+            "open": self.created - self.closed,
+            "in_use": self.checked_out - self.checked_in,
+            "created": self.created,
+            "closed": self.closed,
+            "checkouts": self.checked_out,
+            "checkout_failed": self.checkout_failed,
+        }
+
+
+pool_stats = PoolStats()
+command_metrics = MongoCommandMetrics(settings.MONGO_REPLY_BYTES_SAMPLE_RATE)
+
+# Cliente del proceso; se crea en init_db y se cierra en close_db
+client: Optional[AsyncMongoClient] = None
+
+
+def client_options() -> dict:
+    """Opciones del pool de conexiones, tomadas de la configuración."""
+    options = {
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": settings.MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": settings.MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": settings.MONGO_SOCKET_TIMEOUT_MS,
+        "readPreference": settings.MONGO_READ_PREFERENCE,
+    }
+    # Solo se negocia compresión si se ha configurado
+    if settings.MONGO_COMPRESSORS:
+        options["compressors"] = settings.MONGO_COMPRESSORS
+    return options
+
+
+async def init_db(document_models: Optional[list] = None):
     """
     Initializes the database connection and Beanie ODM.
+    'document_models' limita los modelos registrados (por defecto, todos).
     """
-    client = motor.motor_asyncio.AsyncIOMotorClient(
-        settings.DATABASE_URL
+    document_models = document_models or DOCUMENT_MODELS
+    global client
+    # Beanie 2 trabaja sobre el cliente asíncrono nativo de PyMongo
+    # (con Motor, las agregaciones de Beanie fallan)
+    client = AsyncMongoClient(
+        settings.DATABASE_URL,
+        event_listeners=[pool_stats, command_metrics],
+        **client_options()
     )
 
     # 2. Añade los modelos a la lista `document_models`
     await init_beanie(
         database=client[settings.DATABASE_NAME],
-        document_models=[
-            User,
-            Plan,
-            Typography,
-            Campaign,
-        ]
+        document_models=document_models,
+        # Los índices se crean después, uno a uno: un índice único bloqueado
+        # por datos repetidos no debe impedir el arranque
+        skip_indexes=True
     )
-    print("Database connection successful and Beanie initialized.")
\ No newline at end of file
+    print("Database connection successful and Beanie initialized.")
+
+    # 3. Crea los índices declarados en los modelos y comprueba que existen
+    pending = await ensure_indexes(document_models)
+    await verify_indexes(document_models, pending)
+
+
+async def close_db():
+    """Cierra el cliente y sus conexiones (al apagar la aplicación)."""
+    global client
+    if client is not None:
+        await client.close()
+        client = None
+        print("Database connection closed.")
+
+
+async def ping_db(timeout: float = 2.0) -> float:
+    """
+    Hace un ping a MongoDB y devuelve el tiempo de respuesta en milisegundos.
+    Lanza una excepción si no hay cliente o si el servidor no responde a tiempo.
+    """
+    if client is None:
+        raise RuntimeError("La base de datos no está inicializada.")
+    start = time.perf_counter()
+    await asyncio.wait_for(client.admin.command("ping"), timeout)
+    return (time.perf_counter() - start) * 1000
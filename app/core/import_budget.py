@@ -0,0 +1,91 @@
+# app/core/import_budget.py
+"""
+Presupuesto de tiempo de importación de la aplicación (arranque en frío).
+
+Importa el módulo de entrada con "python -X importtime" en un proceso nuevo
+y falla (código 1) si:
+
+- el tiempo total supera el presupuesto (se toma el mejor de varios
+  intentos, para no depender del ruido de la máquina), o
+- al arrancar se importa alguna dependencia pesada que debe cargarse en
+  el primer uso (pandas, openpyxl, SendGrid, Cloudinary...).
+
+    python -m app.core.import_budget
+    python -m app.core.import_budget --module app.claim_main --budget-ms 1000
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+
+DEFAULT_MODULE = "app.main"
+DEFAULT_BUDGET_MS = 1500
+DEFAULT_RUNS = 3
+
+# Dependencias que solo se importan al usarse (importación, exportación, envío, subidas)
+DEFERRED_MODULES = ("pandas", "numpy", "openpyxl", "sendgrid", "cloudinary", "requests", "fontTools")
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def measure(module: str) -> tuple[float, dict[str, float]]:
+    """
+    Importa el módulo en un intérprete nuevo. Devuelve el tiempo total (ms) y
+    el tiempo acumulado (ms) de cada módulo importado.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {module}:\n{result.stderr[-2000:]}")
+
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            cumulative[match.group(4)] = int(match.group(2)) / 1000
+    return cumulative[module], cumulative
+
+
+def check(module: str, budget_ms: float, runs: int) -> list[str]:
+    """Devuelve los problemas encontrados (lista vacía si todo está en orden)."""
+    best_total, best_modules = None, {}
+    for _ in range(runs):
+        total, modules = measure(module)
+        if best_total is None or total < best_total:
+            best_total, best_modules = total, modules
+
+    slowest = sorted(
+        ((name, ms) for name, ms in best_modules.items() if "." not in name and name != module),
+        key=lambda item: item[1], reverse=True
+    )[:10]
+    print(f"Importar {module}: {best_total:.0f} ms (mejor de {runs}; presupuesto {budget_ms:.0f} ms)")
+    for name, ms in slowest:
+        print(f"    {ms:8.1f} ms  {name}")
+
+    problems = []
+    if best_total > budget_ms:
+        problems.append(f"El arranque tarda {best_total:.0f} ms, por encima del presupuesto de {budget_ms:.0f} ms.")
+    for name in DEFERRED_MODULES:
+        if name in best_modules:
+            problems.append(f"'{name}' se importa al arrancar; debe importarse en el primer uso.")
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default=DEFAULT_MODULE)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    args = parser.parse_args()
+
+    problems = check(args.module, args.budget_ms, args.runs)
+    for problem in problems:
+        print(f"ERROR: {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+# app/core/indexes.py
+"""
+Índices de MongoDB: verificación al arrancar y diagnóstico de consultas.
+
+Los índices se declaran en los modelos (Indexed(...) o Settings.indexes);
+init_db los crea con ensure_indexes (que informa de los duplicados que
+impiden crear un índice único) y verify_indexes comprueba que existen.
+
+Diagnóstico (ejecuta explain() sobre cada forma de consulta registrada y
+marca los COLLSCAN y las consultas poco selectivas):
+
+    python -m app.core.indexes
+"""
+
+from beanie import Document, PydanticObjectId
+from beanie.odm.fields import IndexModelField
+from beanie.odm.utils.pydantic import get_model_fields
+from beanie.odm.utils.typing import get_index_attributes
+from dataclasses import dataclass, field
+from datetime import datetime
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+from typing import Optional
+import asyncio
+import sys
+
+# Una consulta se marca como poco selectiva si examina más de este número de
+# documentos por documento devuelto (y al menos MIN_DOCS_EXAMINED en total)
+SELECTIVITY_RATIO = 10
+MIN_DOCS_EXAMINED = 100
+
+# Código de error de MongoDB para claves duplicadas (E11000)
+DUPLICATE_KEY_ERROR = 11000
+
+# Valores repetidos que se muestran por índice único que no se puede crear
+DUPLICATES_REPORTED = 20
+
+
+def index_models(model: type[Document]) -> list[IndexModel]:
+    """Índices declarados en el modelo (Indexed(...) y Settings.indexes), como IndexModel."""
+    indexes = []
+    for name, model_field in get_model_fields(model).items():
+        attributes = get_index_attributes(model_field)
+        if attributes is not None:
+            indexes.append(IndexModel([(model_field.alias or name, attributes[0])], **attributes[1]))
+    for index in model.get_settings().indexes or []:
+        indexes.append(index.index if isinstance(index, IndexModelField) else IndexModel(index))
+    return indexes
+
+
+def declared_indexes(model: type[Document]) -> list[list[tuple[str, int]]]:
+    """Claves de los índices declarados en el modelo, como en el diccionario de MongoDB."""
+    return [list(index.document["key"].items()) for index in index_models(model)]
+
+
+def _duplicates_pipeline(keys: list[str], limit: int) -> list[dict]:
+    """
+    Agrupa por las claves del índice y devuelve los valores repetidos. Se
+    desenrollan los arrays de cada ruta, así que también cuenta los repetidos
+    dentro de un mismo documento (que un índice único multikey no impide).
+    """
+    pipeline = []
+    prefixes = sorted({".".join(key.split(".")[:depth]) for key in keys for depth in range(1, key.count(".") + 1)})
+    for prefix in prefixes:
+        pipeline.append({"$unwind": f"${prefix}"})
+    pipeline += [
+        {"$match": {key: {"$exists": True} for key in keys}},
+        {"$group": {
+            "_id": {key.replace(".", "_"): f"${key}" for key in keys},
+            "count": {"$sum": 1},
+            "documents": {"$addToSet": "$_id"},
+        }},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$sort": {"count": -1}},
+        {"$limit": limit},
+    ]
+    return pipeline
+
+
+async def find_duplicates(model: type[Document], keys: list[str], limit: int = DUPLICATES_REPORTED) -> list[dict]:
+    """Valores repetidos de las claves de un índice único (los que impiden crearlo)."""
+    cursor = await model.get_pymongo_collection().aggregate(_duplicates_pipeline(keys, limit))
+    return await cursor.to_list(length=None)
+
+
+async def ensure_indexes(models: list[type[Document]]) -> list[str]:
+    """
+    Crea los índices declarados uno a uno. Si un índice único no se puede
+    crear porque ya hay valores repetidos, se informa de los duplicados y el
+    arranque continúa sin él (hay que corregir los datos y reiniciar).
+    Devuelve los nombres de los índices pendientes.
+    """
+    pending = []
+    for model in models:
+        collection = model.get_pymongo_collection()
+        for index in index_models(model):
+            try:
+                await collection.create_indexes([index])
+            except OperationFailure as e:
+                if not index.document.get("unique") or e.code != DUPLICATE_KEY_ERROR:
+                    raise
+                keys = list(index.document["key"])
+                name = f"{collection.name}.{index.document['name']}"
+                pending.append(name)
+                print(f"AVISO: no se pudo crear el índice único {name}: hay valores repetidos en {keys}.")
+                for duplicate in await find_duplicates(model, keys):
+                    documents = ", ".join(str(document_id) for document_id in duplicate["documents"])
+                    print(f"    {duplicate['_id']}: {duplicate['count']} veces (documentos: {documents})")
+    return pending
+
+
+async def verify_indexes(models: list[type[Document]], pending: Optional[list[str]] = None):
+    """
+    Comprueba que cada índice declarado existe en su colección. Si falta
+    alguno (p. ej. porque su creación falló), el arranque se detiene; los
+    índices únicos bloqueados por duplicados ('pending') solo se avisan.
+    """
+    missing = []
+    for model in models:
+        collection = model.get_pymongo_collection()
+        information = await collection.index_information()
+        existing = [[(key, direction) for key, direction in index["key"]] for index in information.values()]
+        for index in index_models(model):
+            keys = list(index.document["key"].items())
+            if keys not in existing and f"{collection.name}.{index.document['name']}" not in (pending or []):
+                missing.append(f"{collection.name}: {keys}")
+
+    if missing:
+        raise RuntimeError("Faltan índices en la base de datos: " + "; ".join(missing))
+    if pending:
+        print(f"Índices verificados en {len(models)} colecciones; pendientes por duplicados: {', '.join(pending)}.")
+    else:
+        print(f"Índices verificados en {len(models)} colecciones.")
+
+
+# --- Formas de consulta usadas por los servicios ---
+
+@dataclass
+class QueryShape:
+    """
+    Una consulta tal como la hacen los servicios, con valores de ejemplo.
+    El plan que elige MongoDB depende de la forma, no de los valores.
+    """
+    name: str
+    collection: str
+    filter: dict
+    sort: Optional[list] = None
+    limit: int = 0
+    issues: list[str] = field(default_factory=list)
+
+
+def query_shapes() -> list[QueryShape]:
+    """Consultas registradas. Al añadir una consulta nueva a un servicio, añadirla aquí."""
+    some_id = PydanticObjectId()
+    newest = [("updated_at", -1), ("_id", -1)]
+    return [
+        QueryShape("Usuario por email (login, token)", "users", {"email": "ejemplo@certhub.com"}),
+        QueryShape("Plan por nombre (registro)", "plans", {"name": "Gratuito"}),
+        QueryShape("Tipografía por nombre", "typographies", {"name": "Roboto"}),
+        QueryShape("Campañas del usuario (conteo)", "campaigns", {"user_id": some_id}),
+        QueryShape("Campañas del usuario (listado)", "campaigns", {"user_id": some_id}, newest, 51),
+        QueryShape("Campañas del usuario (página siguiente)", "campaigns", {
+            "user_id": some_id,
+            "$or": [
+                {"updated_at": {"$lt": datetime.utcnow()}},
+                {"updated_at": datetime.utcnow(), "_id": {"$lt": some_id}},
+            ],
+        }, newest, 51),
+        QueryShape("Campaña del usuario (destinatarios, estadísticas, importación)", "campaigns", {"_id": some_id, "user_id": some_id}),
+        QueryShape("Campaña por código de destinatario (reclamación)", "campaigns", {"recipients.unique_code": "ABCD1234"}),
+        QueryShape("Estado de un destinatario (envío)", "campaigns", {
+            "_id": some_id,
+            "recipients": {"$elemMatch": {"unique_code": "ABCD1234", "email_status": "PENDING"}},
+        }),
+        QueryShape("Asset por hash", "assets", {"sha256": "0" * 64}),
+        QueryShape("Asset por URL", "assets", {"url": "https://example.com/asset.png"}),
+        QueryShape("Importación de una campaña", "import_jobs", {"_id": some_id, "campaign_id": some_id, "user_id": some_id}),
+    ]
+
+
+def _plan_stages(plan: dict) -> list[dict]:
+    """Etapas de un plan de ejecución (recorre inputStage, inputStages y queryPlan)."""
+    stages = [plan]
+    for key in ("inputStage", "queryPlan"):
+        if isinstance(plan.get(key), dict):
+            stages.extend(_plan_stages(plan[key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+
+async def explain_query_shape(database, shape: QueryShape) -> dict:
+    """Ejecuta explain() y anota en la forma los problemas encontrados."""
+    cursor = database[shape.collection].find(shape.filter)
+    if shape.sort:
+        cursor = cursor.sort(shape.sort)
+    if shape.limit:
+        cursor = cursor.limit(shape.limit)
+    explanation = await cursor.explain()
+
+    stages = _plan_stages(explanation["queryPlanner"]["winningPlan"])
+    stage_names = [stage["stage"] for stage in stages if "stage" in stage]
+    index_names = [stage["indexName"] for stage in stages if "indexName" in stage]
+    if "COLLSCAN" in stage_names:
+        shape.issues.append("COLLSCAN: la consulta recorre toda la colección")
+    if "SORT" in stage_names:
+        shape.issues.append("SORT en memoria: ningún índice cubre el orden")
+
+    stats = explanation.get("executionStats", {})
+    docs_examined = stats.get("totalDocsExamined", 0)
+    returned = stats.get("nReturned", 0)
+    if docs_examined >= MIN_DOCS_EXAMINED and docs_examined > SELECTIVITY_RATIO * max(returned, 1):
+        shape.issues.append(f"Poco selectiva: examina {docs_examined} documentos para devolver {returned}")
+
+    return {"stages": stage_names, "indexes": index_names, "docs_examined": docs_examined, "returned": returned}
+
+
+async def run_diagnostics() -> int:
+    """Explica todas las formas de consulta. Devuelve el número de consultas con problemas."""
+    from app.core.database import init_db
+    from app.models.user_model import User
+
+    await init_db()
+    database = User.get_pymongo_collection().database
+
+    with_issues = 0
+    for shape in query_shapes():
+        result = await explain_query_shape(database, shape)
+        plan = " > ".join(reversed(result["stages"]))
+        indexes = ", ".join(result["indexes"]) or "ninguno"
+        print(f"[{'ERROR' if shape.issues else 'OK'}] {shape.name} ({shape.collection})")
+        print(f"    plan: {plan} | índices: {indexes} | examinados: {result['docs_examined']} | devueltos: {result['returned']}")
+        for issue in shape.issues:
+            print(f"    - {issue}")
+        with_issues += bool(shape.issues)
+
+    print(f"\n{with_issues} de {len(query_shapes())} consultas con problemas.")
+    return with_issues
+
+
+if __name__ == "__main__":
+    sys.exit(1 if asyncio.run(run_diagnostics()) else 0)
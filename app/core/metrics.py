@@ -0,0 +1,253 @@
+# app/core/metrics.py
+"""
+Métricas del proceso en formato Prometheus, expuestas en /metrics.
+
+Con varios workers de gunicorn, cada proceso escribe sus valores en
+PROMETHEUS_MULTIPROC_DIR (lo configura gunicorn.conf.py) y /metrics los
+agrega. En los caminos calientes solo se incrementan contadores ya
+resueltos (labels() se llama una vez, al importar el módulo).
+
+Cada petición HTTP lleva un RequestMetrics en una variable de contexto; los
+comandos de MongoDB (y lo que se ejecute en hilos con asyncio.to_thread, que
+copia el contexto) se atribuyen a la ruta de la petición en curso. La ruta
+es la plantilla de FastAPI (/campaigns/{campaign_id}), nunca la URL, para
+no disparar el número de series.
+"""
+
+from contextvars import ContextVar
+from typing import Optional
+import os
+import random
+import time
+
+import bson
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+)
+from pymongo import monitoring
+
+# Etiqueta de ruta fuera de una petición (arranque, tareas propias)
+NO_ROUTE = "-"
+
+# Comandos cuya respuesta trae documentos; las demás ocupan unos pocos bytes
+CURSOR_COMMANDS = frozenset({"find", "aggregate", "getMore"})
+
+# Segundos: de 0,5 ms a 10 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# --- HTTP ---
+
+REQUEST_SECONDS = Histogram(
+    "certhub_request_seconds",
+    "Latencia de las peticiones HTTP hasta el último byte de la respuesta, por ruta.",
+    ["route", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+# --- Render de certificados ---
+
+RENDER_STAGE_SECONDS = Histogram(
+    "certhub_render_stage_seconds",
+    "Duración de cada etapa del render de certificados.",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+RENDER_FETCH_SECONDS = RENDER_STAGE_SECONDS.labels("fetch")    # Descarga de plantilla, fuente o certificado
+RENDER_DECODE_SECONDS = RENDER_STAGE_SECONDS.labels("decode")  # Decodificación de la plantilla y la fuente
+RENDER_DRAW_SECONDS = RENDER_STAGE_SECONDS.labels("draw")      # Maquetación y dibujo del texto
+RENDER_ENCODE_SECONDS = RENDER_STAGE_SECONDS.labels("encode")  # PNG, JPEG, WEBP o PDF
+RENDER_UPLOAD_SECONDS = RENDER_STAGE_SECONDS.labels("upload")  # Guardado del certificado generado
+
+# --- Correos ---
+
+EMAILS = Counter(
+    "certhub_emails",
+    "Correos enviados por campaña y resultado (sent, failed).",
+    ["campaign_id", "result"],
+)
+
+# --- Importación de destinatarios ---
+
+IMPORT_ROWS = Counter(
+    "certhub_import_rows",
+    "Filas del Excel procesadas, por resultado (imported, skipped).",
+    ["result"],
+)
+IMPORT_JOB_SECONDS = Histogram(
+    "certhub_import_job_seconds",
+    "Duración de los trabajos de importación, por estado final.",
+    ["status"],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+
+# --- Cachés en memoria (la tasa de aciertos se calcula en la consulta) ---
+
+CACHE_REQUESTS = Counter(
+    "certhub_cache_requests",
+    "Consultas a las cachés con nombre, por resultado (hit, miss).",
+    ["cache", "result"],
+)
+
+# --- MongoDB ---
+
+MONGO_COMMAND_SECONDS = Histogram(
+    "certhub_mongo_command_seconds",
+    "Duración de los comandos de MongoDB, por ruta, comando y colección.",
+    ["route", "command", "collection"],
+    buckets=LATENCY_BUCKETS,
+)
+MONGO_REPLY_BYTES = Counter(
+    "certhub_mongo_reply_bytes",
+    "Bytes devueltos por MongoDB en find/aggregate/getMore, por ruta, comando y colección "
+    "(estimados a partir de una muestra de las respuestas).",
+    ["route", "command", "collection"],
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "certhub_mongo_command_failures",
+    "Comandos de MongoDB fallidos, por ruta, comando y colección.",
+    ["route", "command", "collection"],
+)
+REQUEST_MONGO_SECONDS = Histogram(
+    "certhub_request_mongo_seconds",
+    "Tiempo total en MongoDB por petición, por ruta.",
+    ["route"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_MONGO_COMMANDS = Histogram(
+    "certhub_request_mongo_commands",
+    "Comandos de MongoDB por petición, por ruta.",
+    ["route"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 250),
+)
+
+
+class RequestMetrics:
+    """Acumulados de una petición HTTP."""
+    __slots__ = ("scope", "started", "mongo_seconds", "mongo_commands")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.started = time.perf_counter()
+        self.mongo_seconds = 0.0
+        self.mongo_commands = 0
+
+    @property
+    def route(self) -> str:
+        # El router de FastAPI deja la ruta resuelta en el scope
+        route = self.scope.get("route")
+        return getattr(route, "path", NO_ROUTE)
+
+
+_current_request: ContextVar[Optional[RequestMetrics]] = ContextVar("request_metrics", default=None)
+
+
+def current_request() -> Optional[RequestMetrics]:
+    return _current_request.get()
+
+
+def current_route() -> str:
+    request = _current_request.get()
+    return request.route if request else NO_ROUTE
+
+
+class RequestMetricsMiddleware:
+    """
+    Middleware ASGI: crea el RequestMetrics de cada petición. La latencia se
+    mide hasta el último byte de la respuesta (sin las BackgroundTasks, que
+    se ejecutan después); los totales de MongoDB, al terminar la petición,
+    con las BackgroundTasks incluidas.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = RequestMetrics(scope)
+        status_code = 500
+        observed = False
+
+        async def send_wrapper(message):
+            nonlocal status_code, observed
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False) and not observed:
+                observed = True
+                REQUEST_SECONDS.labels(request.route, scope["method"], status_code).observe(
+                    time.perf_counter() - request.started
+                )
+
+        token = _current_request.set(request)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_request.reset(token)
+            route = request.route
+            if not observed:
+                REQUEST_SECONDS.labels(route, scope["method"], status_code).observe(
+                    time.perf_counter() - request.started
+                )
+            REQUEST_MONGO_SECONDS.labels(route).observe(request.mongo_seconds)
+            REQUEST_MONGO_COMMANDS.labels(route).observe(request.mongo_commands)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    Listener de comandos de PyMongo. El driver lo llama de forma síncrona
+    dentro de la operación, así que la variable de contexto es la de la
+    petición que lanzó la consulta.
+
+    Medir una respuesta exige volver a codificarla en BSON, tan caro como
+    recibirla: solo se mide una fracción ('reply_bytes_sample_rate', 0 lo
+    desactiva) de las respuestas con documentos, y se escala el resultado.
+    """
+    def __init__(self, reply_bytes_sample_rate: float = 0.0):
+        # (conexión, request_id) -> colección; el evento de fin no la trae
+        self._collections: dict = {}
+        self.reply_bytes_sample_rate = reply_bytes_sample_rate
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        self._collections[(event.connection_id, event.request_id)] = (
+            collection if isinstance(collection, str) else "-"
+        )
+
+    def _finish(self, event, duration: float) -> tuple[str, str, str]:
+        collection = self._collections.pop((event.connection_id, event.request_id), "-")
+        request = _current_request.get()
+        if request:
+            request.mongo_seconds += duration
+            request.mongo_commands += 1
+        return (request.route if request else NO_ROUTE), event.command_name, collection
+
+    def succeeded(self, event):
+        duration = event.duration_micros / 1_000_000
+        labels = self._finish(event, duration)
+        MONGO_COMMAND_SECONDS.labels(*labels).observe(duration)
+        rate = self.reply_bytes_sample_rate
+        if rate and event.command_name in CURSOR_COMMANDS and random.random() < rate:
+            MONGO_REPLY_BYTES.labels(*labels).inc(len(bson.encode(event.reply)) / rate)
+
+    def failed(self, event):
+        duration = event.duration_micros / 1_000_000
+        labels = self._finish(event, duration)
+        MONGO_COMMAND_SECONDS.labels(*labels).observe(duration)
+        MONGO_COMMAND_FAILURES.labels(*labels).inc()
+
+
+def render_latest() -> tuple[bytes, str]:
+    """
+    Métricas en formato de texto de Prometheus. Con PROMETHEUS_MULTIPROC_DIR
+    se agregan las de todos los workers; si no, las del proceso.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
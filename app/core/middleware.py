@@ -0,0 +1,35 @@
+# app/core/middleware.py
+
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+
+from .compression import CompressionMiddleware
+from .config import settings
+from .metrics import RequestMetricsMiddleware
+from .profiling import ProfilingMiddleware
+from .tracing import TracingMiddleware
+
+
+def add_middleware(app: FastAPI):
+    """
+    Middleware común a las aplicaciones (API completa y app de reclamación).
+    Starlette ejecuta primero el último añadido, así que el orden importa.
+    """
+    # La compresión queda dentro de las métricas, que así incluyen su coste
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MINIMUM_SIZE)
+    origins = ["*"]
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],  # Permite todos los métodos (GET, POST, etc.)
+        allow_headers=["*"],  # Permite todos los encabezados
+        expose_headers=["Server-Timing", "X-Request-ID", "X-Next-Cursor", "Location"],
+    )
+    # Perfilado de una petición con el token de administración (solo si está configurado)
+    if settings.PROFILE_TOKEN:
+        app.add_middleware(ProfilingMiddleware)
+    # Server-Timing, X-Request-ID y log por petición (dentro de las métricas)
+    app.add_middleware(TracingMiddleware)
+    # Atribuye las consultas a MongoDB a la ruta de cada petición
+    app.add_middleware(RequestMetricsMiddleware)
@@ -0,0 +1,41 @@
+# app/core/migrations.py
+"""
+Migraciones de datos de un solo uso. No se ejecutan al arrancar (lo haría
+cada worker, en cada arranque): se lanzan una vez tras el despliegue que
+las introduce. Son idempotentes, así que repetirlas no cambia nada.
+
+    python -m app.core.migrations              (lista las migraciones)
+    python -m app.core.migrations backfill_stats
+"""
+
+import asyncio
+import sys
+
+
+def migrations() -> dict:
+    """Migraciones disponibles, por nombre."""
+    from app.services import recipient_service
+
+    return {
+        # Contadores de las campañas importadas antes de que existieran
+        "backfill_stats": recipient_service.backfill_stats,
+    }
+
+
+async def run_migration(name: str):
+    from app.core.database import close_db, init_db
+
+    await init_db()
+    try:
+        await migrations()[name]()
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    available = migrations()
+    if len(sys.argv) != 2 or sys.argv[1] not in available:
+        print("Uso: python -m app.core.migrations <migración>")
+        print("Migraciones: " + ", ".join(available))
+        sys.exit(2)
+    asyncio.run(run_migration(sys.argv[1]))
@@ -0,0 +1,160 @@
+# app/core/profiling.py
+"""
+Perfilado bajo demanda de una petición, con datos reales de producción.
+
+Solo se activa si PROFILE_TOKEN está configurado (si no, main.py ni siquiera
+añade el middleware). Una petición se perfila si trae el token en la
+cabecera X-Profile o en el parámetro ?profile=:
+
+    curl -X POST -H "X-Profile: $PROFILE_TOKEN" -H "Content-Type: application/json" \\
+         -d '{"unique_code": "ABCD1234"}' -o /dev/null -D - \\
+         http://localhost:8000/certificates/claim
+    curl -X POST -H "Content-Type: application/json" -d '{"unique_code": "ABCD1234"}' \\
+         "http://localhost:8000/certificates/claim?profile=$PROFILE_TOKEN&profile_output=inline"
+
+Un hilo muestrea las pilas de todos los hilos cada PROFILE_INTERVAL_MS (el
+event loop y los hilos de asyncio.to_thread, donde se renderiza). En el
+event loop se mezclan las demás peticiones concurrentes: conviene perfilar
+en un worker con poco tráfico.
+
+El resultado está en formato "collapsed" (una pila por línea con su número
+de muestras), que leen flamegraph.pl, speedscope e inferno. Por defecto se
+guarda en PROFILE_DIR (la ruta va en la cabecera X-Profile-File); con
+profile_output=inline se devuelve en lugar de la respuesta.
+"""
+
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs
+import asyncio
+import re
+import secrets
+import sys
+import threading
+import time
+
+from .config import settings
+from .tracing import current_request_id
+
+# Funciones en las que un hilo está esperando, no trabajando
+_IDLE_FUNCTIONS = {"select", "poll", "epoll", "wait", "_wait_for_tstate_lock", "_worker"}
+
+
+class SamplingProfiler:
+    """Muestrea sys._current_frames() desde un hilo propio."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or frame.f_code.co_name in _IDLE_FUNCTIONS:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """Pilas en formato collapsed, de la más a la menos muestreada."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+def _requested(scope) -> tuple[bool, bool]:
+    """(perfilar, devolver el perfil en la respuesta) según cabecera o query."""
+    headers = dict(scope["headers"])
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    token = headers.get(b"x-profile", b"").decode("latin-1") or query.get("profile", [""])[0]
+    if not token or not secrets.compare_digest(token, settings.PROFILE_TOKEN):
+        return False, False
+    output = headers.get(b"x-profile-output", b"").decode("latin-1") or query.get("profile_output", [""])[0]
+    return True, output == "inline"
+
+
+def _profile_path(scope) -> Path:
+    route = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root"
+    name = f"{datetime.utcnow():%Y%m%dT%H%M%S}_{route[:60]}_{current_request_id() or secrets.token_hex(4)}.collapsed"
+    return Path(settings.PROFILE_DIR) / name
+
+
+def _write_profile(path: Path, content: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content, encoding="utf-8")
+
+
+class ProfilingMiddleware:
+    """
+    Middleware ASGI: perfila las peticiones que traen el token. Debe quedar
+    dentro de TracingMiddleware (añadirse antes) para usar su id de petición.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        enabled, inline = _requested(scope)
+        if not enabled:
+            await self.app(scope, receive, send)
+            return
+
+        profiler = SamplingProfiler(settings.PROFILE_INTERVAL_MS / 1000)
+        path = _profile_path(scope)
+        status_code: Optional[int] = None
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if inline:
+                    return
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-file", str(path).encode())]}
+            elif inline:
+                # El cuerpo original se descarta: la respuesta es el perfil
+                return
+            await send(message)
+
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            elapsed = time.perf_counter() - started
+            content = profiler.collapsed()
+            print(f"Perfil de {scope['method']} {scope['path']}: {sum(profiler.samples.values())} muestras en {elapsed:.2f} s")
+            if not inline:
+                await asyncio.to_thread(_write_profile, path, content)
+
+        if inline:
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/plain; charset=utf-8"),
+                    (b"content-disposition", f'attachment; filename="{path.name}"'.encode()),
+                    (b"x-profile-status", str(status_code).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": content.encode("utf-8")})
@@ -0,0 +1,89 @@
+# app/core/read_preference.py
+"""
+Preferencia de lectura por operación.
+
+Por defecto todas las consultas van al primario (MONGO_READ_PREFERENCE).
+Las funciones de servicio de solo lectura que toleran datos algo atrasados
+(listados, estadísticas, catálogo de tipografías) se marcan con
+@secondary_reads: mientras se ejecutan, las lecturas de los modelos con
+ReadPreferenceMixin van a un secundario (secondaryPreferred, con un atraso
+máximo de MONGO_MAX_STALENESS_SECONDS). Las escrituras siempre van al
+primario, y las rutas que leen lo que acaban de escribir (reclamación,
+edición de campañas) simplemente no se marcan.
+
+Para probarlo con un replica set local:
+
+    docker run -d -p 27017:27017 mongo:7 --replSet rs0
+    docker exec <id> mongosh --eval "rs.initiate()"   # y añadir secundarios
+
+y comprobar en db.currentOp() / el profiler de cada nodo dónde llegan las lecturas.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Optional
+
+from pymongo.read_preferences import Primary, SecondaryPreferred, _ServerMode
+
+from .config import settings
+
+# Preferencia de la operación en curso (None: la del cliente)
+_read_preference: ContextVar[Optional[_ServerMode]] = ContextVar("read_preference", default=None)
+
+
+def secondary_preference() -> Optional[_ServerMode]:
+    """Preferencia para las lecturas marcadas (None si están desactivadas)."""
+    if not settings.MONGO_SECONDARY_READS:
+        return None
+    return SecondaryPreferred(max_staleness=settings.MONGO_MAX_STALENESS_SECONDS)
+
+
+def current_read_preference() -> Optional[_ServerMode]:
+    return _read_preference.get()
+
+
+@contextmanager
+def read_preference(preference: Optional[_ServerMode]):
+    """Aplica una preferencia de lectura dentro del bloque."""
+    token = _read_preference.set(preference)
+    try:
+        yield
+    finally:
+        _read_preference.reset(token)
+
+
+def secondary_reads(func):
+    """Decorador para funciones de servicio async de solo lectura."""
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        with read_preference(secondary_preference()):
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+def primary_reads(func):
+    """
+    Decorador para forzar el primario, aunque quien llama esté marcado con
+    @secondary_reads (p. ej. una comprobación antes de escribir).
+    """
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        with read_preference(Primary()):
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+class ReadPreferenceMixin:
+    """
+    Para modelos de Beanie: todas las consultas de Beanie obtienen la colección
+    con get_pymongo_collection(), así que basta con devolverla con la
+    preferencia de la operación en curso.
+    """
+    @classmethod
+    def get_pymongo_collection(cls):
+        collection = super().get_pymongo_collection()
+        preference = _read_preference.get()
+        if preference is None:
+            return collection
+        return collection.with_options(read_preference=preference)
@@ -0,0 +1,37 @@
+# app/core/responses.py
+"""
+Respuestas JSON rápidas.
+
+La clase por defecto de las aplicaciones es ORJSONResponse (orjson en lugar
+del json de la biblioteca estándar). Para los listados grandes, además,
+model_response() serializa los modelos ya construidos directamente a bytes
+con pydantic-core: con response_model, FastAPI volvería a validar cada
+elemento y a convertirlo en diccionarios antes de codificarlo. El
+response_model de la ruta se mantiene para la documentación.
+"""
+
+from functools import lru_cache
+from typing import Any, Optional
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+
+@lru_cache(maxsize=None)
+def _adapter(schema) -> TypeAdapter:
+    return TypeAdapter(schema)
+
+
+def model_response(
+    schema,
+    content: Any,
+    status_code: int = 200,
+    headers: Optional[dict] = None
+) -> Response:
+    """Respuesta JSON de 'content', que ya debe ser una instancia de 'schema'."""
+    return Response(
+        content=_adapter(schema).dump_json(content),
+        status_code=status_code,
+        media_type="application/json",
+        headers=headers
+    )
@@ -7,6 +7,7 @@ from fastapi import Depends, HTTPException, status
 
 from app.api.dependencies import oauth2_scheme
 from app.core.config import settings
+from app.core.tracing import span
 from app.models.user_model import User
 
 # Contexto para hashear y verificar contraseñas
@@ -43,16 +44,18 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
-        )
+        with span("auth_token"):
+            payload = jwt.decode(
+                token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
+            )
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
 
-    user = await User.find_one(User.email == email)
+    with span("auth_user"):
+        user = await User.find_one(User.email == email)
     if user is None:
         raise credentials_exception
     
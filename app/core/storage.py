@@ -0,0 +1,186 @@
+# app/core/storage.py
+
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Union
+from urllib.parse import urlparse
+import asyncio
+import os
+import shutil
+import tempfile
+
+from .config import settings
+
+
+def _download(url: str) -> bytes:
+    """Descarga una URL. Bloqueante."""
+    import requests
+
+    response = requests.get(url)
+    response.raise_for_status()
+    return response.content
+
+
+class StorageBackend(ABC):
+    """
+    Almacenamiento de archivos (plantillas, Excel, fuentes, certificados).
+    Las claves son rutas relativas como "assets/<sha256>.png"; 'resource_type'
+    distingue imágenes ("image") del resto de archivos ("raw"). El contenido
+    puede pasarse como bytes o como archivo abierto (p. ej. una subida en disco).
+    """
+
+    @abstractmethod
+    async def put(self, key: str, data: Union[bytes, BinaryIO], resource_type: str = "image") -> str:
+        """Guarda el contenido (reemplazando el anterior) y devuelve su URL pública."""
+
+    @abstractmethod
+    async def delete(self, key: str, resource_type: str = "image"):
+        """Borra el archivo. No falla si ya no existe."""
+
+    @abstractmethod
+    def url(self, key: str, resource_type: str = "image") -> str:
+        """URL pública de una clave."""
+
+    @abstractmethod
+    def fetch(self, url: str) -> bytes:
+        """Lee un archivo a partir de su URL. Bloqueante: llamar desde un hilo."""
+
+    async def get(self, url: str) -> bytes:
+        return await asyncio.to_thread(self.fetch, url)
+
+
+class CloudinaryStorage(StorageBackend):
+    """
+    Cloudinary. El SDK es síncrono, así que cada llamada se ejecuta en un hilo,
+    con un máximo de llamadas simultáneas para no agotar el pool de hilos.
+    """
+    def __init__(self, cloud_name: str, api_key: str, api_secret: str, root_folder: str, max_concurrency: int):
+        self._credentials = {"cloud_name": cloud_name, "api_key": api_key, "api_secret": api_secret}
+        self._sdk = None
+        self._root_folder = root_folder
+        self._max_concurrency = max_concurrency
+        self._semaphores: dict = {}
+
+    @property
+    def _cloudinary(self):
+        # El SDK se importa y configura en el primer uso, no al arrancar
+        if self._sdk is None:
+            import cloudinary
+            import cloudinary.uploader
+            import cloudinary.utils
+
+            cloudinary.config(**self._credentials, secure=True)
+            self._sdk = cloudinary
+        return self._sdk
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # Un semáforo por event loop (cada worker y cada test tienen el suyo)
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self._max_concurrency)
+        return semaphore
+
+    def _public_id(self, key: str, resource_type: str) -> str:
+        # En las imágenes la extensión no forma parte del public_id
+        if resource_type == "image":
+            key = os.path.splitext(key)[0]
+        return f"{self._root_folder}/{key}"
+
+    async def put(self, key: str, data: Union[bytes, BinaryIO], resource_type: str = "image") -> str:
+        async with self._semaphore():
+            result = await asyncio.to_thread(
+                self._cloudinary.uploader.upload,
+                data,
+                public_id=self._public_id(key, resource_type),
+                resource_type=resource_type,
+                overwrite=True,
+                invalidate=True,
+            )
+        return result["secure_url"]
+
+    async def delete(self, key: str, resource_type: str = "image"):
+        async with self._semaphore():
+            await asyncio.to_thread(
+                self._cloudinary.uploader.destroy, self._public_id(key, resource_type), resource_type=resource_type
+            )
+
+    def url(self, key: str, resource_type: str = "image") -> str:
+        extension = os.path.splitext(key)[1].lstrip(".") if resource_type == "image" else None
+        url, _ = self._cloudinary.utils.cloudinary_url(
+            self._public_id(key, resource_type), resource_type=resource_type, format=extension, secure=True
+        )
+        return url
+
+    def fetch(self, url: str) -> bytes:
+        return _download(url)
+
+
+class LocalStorage(StorageBackend):
+    """
+    Disco local, servido por la propia API en la ruta de 'base_url'.
+    Pensado para desarrollo y pruebas de carga sin conexión.
+    """
+    def __init__(self, root: str, base_url: str):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip("/")
+        os.makedirs(self.root, exist_ok=True)
+
+    @property
+    def mount_path(self) -> str:
+        """Ruta de la API en la que se montan los archivos estáticos."""
+        return urlparse(self.base_url).path or "/"
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Clave de almacenamiento no válida: {key}")
+        return path
+
+    def _write(self, path: str, data: Union[bytes, BinaryIO]):
+        # Escritura atómica: nunca se sirve un archivo a medio escribir
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as temp_file:
+            if isinstance(data, bytes):
+                temp_file.write(data)
+            else:
+                shutil.copyfileobj(data, temp_file)
+        os.replace(temp_path, path)
+
+    async def put(self, key: str, data: Union[bytes, BinaryIO], resource_type: str = "image") -> str:
+        await asyncio.to_thread(self._write, self._path(key), data)
+        return self.url(key, resource_type)
+
+    async def delete(self, key: str, resource_type: str = "image"):
+        try:
+            await asyncio.to_thread(os.remove, self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def url(self, key: str, resource_type: str = "image") -> str:
+        return f"{self.base_url}/{key}"
+
+    def fetch(self, url: str) -> bytes:
+        # Los archivos propios se leen del disco; cualquier otra URL se descarga
+        if url.startswith(self.base_url + "/"):
+            with open(self._path(url[len(self.base_url) + 1:]), "rb") as stored_file:
+                return stored_file.read()
+        return _download(url)
+
+
+def create_storage() -> StorageBackend:
+    """Crea el backend configurado en STORAGE_BACKEND ("cloudinary" o "local")."""
+    if settings.STORAGE_BACKEND == "local":
+        return LocalStorage(settings.LOCAL_STORAGE_PATH, settings.LOCAL_STORAGE_BASE_URL)
+    if settings.STORAGE_BACKEND == "cloudinary":
+        return CloudinaryStorage(
+            settings.CLOUDINARY_CLOUD_NAME,
+            settings.CLOUDINARY_API_KEY,
+            settings.CLOUDINARY_API_SECRET,
+            root_folder="certhub-api",
+            max_concurrency=settings.STORAGE_MAX_CONCURRENCY,
+        )
+    raise ValueError(f"STORAGE_BACKEND desconocido: {settings.STORAGE_BACKEND}")
+
+
+storage = create_storage()
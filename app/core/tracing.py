@@ -0,0 +1,162 @@
+# app/core/tracing.py
+"""
+Spans ligeros por petición.
+
+    with span("typography"):
+        typography = await Typography.get(...)
+
+Cada petición tiene un RequestTrace (en una variable de contexto, que
+asyncio.to_thread copia a los hilos) con su id y los spans medidos. Al
+responder, TracingMiddleware añade:
+
+- Server-Timing: duración total por nombre de span, más el tiempo en
+  MongoDB ("db"), visible en las herramientas de desarrollo del navegador.
+- X-Request-ID: el recibido del proxy (si es válido) o uno nuevo.
+
+y al terminar escribe una línea JSON con el desglose. Los spans que terminan
+después de enviar las cabeceras (cuerpo en streaming, BackgroundTasks) solo
+aparecen en el log.
+
+Un span puede alimentar además un histograma de Prometheus (p. ej. las
+etapas del render), así que fuera de una petición sigue midiendo.
+"""
+
+from contextvars import ContextVar
+from typing import Optional
+import json
+import re
+import time
+import uuid
+
+from .config import settings
+from .metrics import current_request
+
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+class RequestTrace:
+    """Spans de una petición: (nombre, segundos), en el orden en que terminan."""
+    __slots__ = ("request_id", "spans")
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.spans: list[tuple[str, float]] = []
+
+    def totals(self) -> dict[str, tuple[float, int]]:
+        """Segundos y número de veces por nombre de span."""
+        totals: dict[str, tuple[float, int]] = {}
+        for name, duration in list(self.spans):
+            total, count = totals.get(name, (0.0, 0))
+            totals[name] = (total + duration, count + 1)
+        return totals
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+def current_request_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.request_id if trace else None
+
+
+class span:
+    """
+    Mide un bloque y lo añade a la traza de la petición en curso (y, si se
+    indica, a un histograma de Prometheus). Sin petición ni histograma, no
+    hace nada más que leer el reloj.
+    """
+    __slots__ = ("name", "histogram", "_started")
+
+    def __init__(self, name: str, histogram=None):
+        self.name = name
+        self.histogram = histogram
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._started
+        if self.histogram is not None:
+            self.histogram.observe(duration)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append((self.name, duration))
+        return False
+
+
+def log_event(event: str, **fields):
+    """Línea de log en JSON con el id de la petición en curso."""
+    print(json.dumps({"event": event, "request_id": current_request_id(), **fields}, ensure_ascii=False, default=str))
+
+
+def server_timing(trace: RequestTrace) -> str:
+    """Valor de la cabecera Server-Timing (milisegundos)."""
+    entries = []
+    request = current_request()
+    if request and request.mongo_commands:
+        entries.append(f'db;dur={request.mongo_seconds * 1000:.1f};desc="MongoDB x{request.mongo_commands}"')
+    for name, (total, count) in trace.totals().items():
+        entry = f"{name};dur={total * 1000:.1f}"
+        if count > 1:
+            entry += f';desc="x{count}"'
+        entries.append(entry)
+    return ", ".join(entries)
+
+
+class TracingMiddleware:
+    """
+    Middleware ASGI: asigna el id de la petición, añade Server-Timing y
+    X-Request-ID a la respuesta y registra una línea con el desglose.
+    Debe quedar dentro de RequestMetricsMiddleware (añadirse antes) para
+    poder leer el tiempo en MongoDB.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")
+        if not _REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+        trace = RequestTrace(request_id)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", request_id.encode()))
+                timing = server_timing(trace)
+                if timing:
+                    headers.append((b"server-timing", timing.encode()))
+                    # El frontend (otro origen) puede leerlo con la Performance API
+                    headers.append((b"timing-allow-origin", b"*"))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = _current_trace.set(trace)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            if settings.REQUEST_LOG:
+                request = current_request()
+                route = scope.get("route")
+                print(json.dumps({
+                    "event": "request",
+                    "request_id": request_id,
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": getattr(route, "path", None),
+                    "status": status_code,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                    "db_ms": round(request.mongo_seconds * 1000, 1) if request else None,
+                    "db_commands": request.mongo_commands if request else None,
+                    "spans": {name: round(total * 1000, 1) for name, (total, _) in trace.totals().items()},
+                }))
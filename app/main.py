@@ -1,32 +1,30 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
-from app.core.database import init_db
-from fastapi.middleware.cors import CORSMiddleware
+from app.core.database import init_db, close_db
+from fastapi.staticfiles import StaticFiles
+from app.core.storage import storage, LocalStorage
+from app.core.middleware import add_middleware
 # 1. Importa el router que acabamos de crear
-from app.api import user_api, auth_api, campaign_api, certificate_api, typography_api
+from app.api import user_api, auth_api, campaign_api, certificate_api, typography_api, health_api, metrics_api
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("Iniciando aplicación...")
     await init_db()
     yield
     print("Apagando aplicación...")
+    await close_db()
 
 
 app = FastAPI(
     title="Certificate Generator API",
     description="API para crear y gestionar campañas de certificados.",
     version="0.1.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
-origins = ["*"]
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],  # Permite todos los métodos (GET, POST, etc.)
-    allow_headers=["*"],  # Permite todos los encabezados
-)
+add_middleware(app)
 
 # 2. Incluye el router en la aplicación, asignándole un prefijo y una etiqueta
 app.include_router(user_api.router, prefix="/users", tags=["Users"])
@@ -34,6 +32,12 @@ app.include_router(auth_api.router, prefix="/auth", tags=["Authentication"])
 app.include_router(campaign_api.router, prefix="/campaigns", tags=["Campaigns"])
 app.include_router(certificate_api.router, prefix="/certificates", tags=["Certificates"])
 app.include_router(typography_api.router, prefix="/typographies", tags=["Typographies"])
+app.include_router(health_api.router, prefix="/health", tags=["Health Check"])
+app.include_router(metrics_api.router, tags=["Health Check"])
+
+# Con el almacenamiento local, la propia API sirve los archivos guardados
+if isinstance(storage, LocalStorage):
+    app.mount(storage.mount_path, StaticFiles(directory=storage.root), name="files")
 
 @app.get("/", tags=["Health Check"])
 def read_root():
@@ -0,0 +1,24 @@
+# app/models/asset_model.py
+
+from beanie import Document, Indexed
+from pydantic import Field
+from datetime import datetime
+from typing import Optional
+
+class Asset(Document):
+    """
+    Modelo para los archivos almacenados (plantillas, derivados, Excel, fuentes).
+    Cada contenido distinto se sube una sola vez, identificado por su SHA-256,
+    y se comparte entre todas las campañas y tipografías que lo usan.
+    """
+    sha256: Indexed(str, unique=True) # Huella del contenido
+    url: Indexed(str)                 # URL pública (las referencias se guardan por URL)
+    key: str                          # Clave en el almacenamiento ("assets/<sha256>.png")
+    resource_type: str = "image"      # "image" o "raw"
+    size: int
+    ref_count: int = 0                # Campañas/tipografías que lo referencian
+    deleting_at: Optional[datetime] = None  # Borrado en curso: no admite referencias
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "assets"
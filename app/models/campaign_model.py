@@ -1,9 +1,13 @@
 # app/models/campaign_model.py
 
-from beanie import Document, PydanticObjectId, Indexed
-from pydantic import BaseModel, Field
+from beanie import Document, PydanticObjectId
+from PIL import ImageColor
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pydantic import BaseModel, Field, field_validator
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
+
+from app.core.read_preference import ReadPreferenceMixin
 
 # --- Sub-documento para un Destinatario (Embebido) ---
 class Recipient(BaseModel):
@@ -13,14 +17,62 @@ class Recipient(BaseModel):
     """
     name: str
     email: str
-    unique_code: Indexed(str, unique=True) # ¡Índice para búsquedas rápidas!
+    unique_code: str # Índice único declarado en Campaign.Settings (recipients.unique_code)
     email_status: str = Field(default="PENDING") # PENDING, SENT, FAILED
     certificate_url: Optional[str] = None
     claimed_at: Optional[datetime] = None
+    fields: Dict[str, str] = {} # Columnas adicionales del Excel (curso, fecha, nota...)
+
+
+def _validate_color(v: Optional[str]) -> Optional[str]:
+    """Comprueba que Pillow entiende el color ('#1a2b3c', 'red', 'rgb(0,0,0)'...)."""
+    if v is not None:
+        try:
+            ImageColor.getrgb(v)
+        except ValueError:
+            raise ValueError(f"Color no válido: '{v}'. Usa un color como '#000000' o 'red'")
+    return v
+
+
+# --- Sub-documento para un campo de texto del certificado ---
+class TextField(BaseModel):
+    """
+    Un texto a dibujar sobre la plantilla con el valor de una columna del destinatario.
+    'source' puede ser 'name', 'unique_code', 'email' o cualquier columna adicional del Excel.
+    """
+    source: str
+    pos_x: int
+    pos_y: int
+    font_size: int = Field(gt=0)
+    color: str = "#000000"
+    align: str = "left" # left, center, right
+    anchor: Optional[str] = None # Ancla de Pillow (p. ej. 'la', 'mm'); por defecto según 'align'
+    max_width: Optional[int] = Field(default=None, gt=0)
+    auto_shrink: bool = False # Reduce la fuente hasta caber en max_width
+    min_font_size: int = Field(default=8, gt=0)
+
+    @field_validator("align")
+    @classmethod
+    def validate_align(cls, v):
+        if v not in ("left", "center", "right"):
+            raise ValueError("align debe ser 'left', 'center' o 'right'")
+        return v
+
+    @field_validator("anchor")
+    @classmethod
+    def validate_anchor(cls, v):
+        if v is not None and (len(v) != 2 or v[0] not in "lmr" or v[1] not in "atmsbd"):
+            raise ValueError("anchor debe ser un ancla de Pillow como 'la', 'mm' o 'rs'")
+        return v
+
+    @field_validator("color")
+    @classmethod
+    def validate_color(cls, v):
+        return _validate_color(v)
 
 
 # --- Documento Principal de la Campaña ---
-class Campaign(Document):
+class Campaign(ReadPreferenceMixin, Document):
     """
     Modelo principal para una campaña de certificados.
     """
@@ -28,7 +80,12 @@ class Campaign(Document):
     name: str
     status: str = Field(default="DRAFT") # DRAFT, READY, SENDING, COMPLETED
     template_image_url: Optional[str] = None
+    template_width: Optional[int] = None
+    template_height: Optional[int] = None
+    template_derivatives: Dict[str, str] = {} # preview, email -> URL
+    template_sha256: Optional[str] = None # Hash de la imagen subida, para no repetir subidas
     recipients_file_url: Optional[str] = None
+    recipients_file_sha256: Optional[str] = None
 
     # Agrupamos la configuración en sub-documentos para mayor orden
     class ConfigSettings(BaseModel):
@@ -41,12 +98,34 @@ class Campaign(Document):
         code_font_size: Optional[int] = None
         code_color: Optional[str] = None 
         typography_id: PydanticObjectId
+        # Si hay campos de texto definidos, sustituyen a name_* y code_*
+        text_fields: List[TextField] = []
+
+        @field_validator("name_color", "code_color")
+        @classmethod
+        def validate_color(cls, v):
+            return _validate_color(v)
     class EmailSettings(BaseModel):
         subject: str
         body: str
+    class OutputSettings(BaseModel):
+        format: str = "PNG" # PNG, JPEG, WEBP, PDF
+        png_compress_level: int = Field(default=6, ge=0, le=9)
+        jpeg_quality: int = Field(default=85, ge=1, le=95)
+        webp_quality: int = Field(default=80, ge=1, le=100)
+        webp_lossless: bool = False
+    class StatsCounters(BaseModel):
+        # Contadores desnormalizados: se actualizan con $inc al enviar y reclamar
+        total: int = 0
+        pending: int = 0
+        sent: int = 0
+        failed: int = 0
+        claimed: int = 0
 
     config: ConfigSettings
     email: EmailSettings
+    output: OutputSettings = Field(default_factory=OutputSettings)
+    stats: StatsCounters = Field(default_factory=StatsCounters)
 
     # Array de documentos embebidos
     recipients: List[Recipient] = []
@@ -55,4 +134,21 @@ class Campaign(Document):
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
     class Settings:
-        name = "campaigns"
\ No newline at end of file
+        name = "campaigns"
+        indexes = [
+            # Listado de campañas del usuario, de la más reciente a la más antigua
+            # (también sirve para contar las campañas del usuario)
+            IndexModel(
+                [("user_id", ASCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)],
+                name="user_id_updated_at_id",
+            ),
+            # Reclamación de certificados por código. Los índices de los
+            # sub-modelos (Indexed en Recipient) no se crean, por eso se declara
+            # aquí. Parcial: las campañas sin destinatarios no entran en el índice.
+            IndexModel(
+                [("recipients.unique_code", ASCENDING)],
+                name="recipients_unique_code",
+                unique=True,
+                partialFilterExpression={"recipients.unique_code": {"$exists": True}},
+            ),
+        ]
\ No newline at end of file
@@ -0,0 +1,43 @@
+# app/models/import_job_model.py
+
+from beanie import Document, PydanticObjectId, Indexed
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import List, Optional
+
+# --- Sub-documento: una fila del Excel que no se pudo importar ---
+class RowIssue(BaseModel):
+    row: int     # Número de fila en el Excel (la cabecera es la fila 1)
+    reason: str
+
+
+class ImportJob(Document):
+    """
+    Modelo para las importaciones de destinatarios en segundo plano.
+    La subida devuelve el trabajo al momento; el Excel se procesa después
+    y el progreso se consulta con GET /campaigns/{id}/imports/{job_id}.
+    """
+    campaign_id: Indexed(PydanticObjectId)
+    user_id: PydanticObjectId
+    status: str = Field(default="PENDING") # PENDING, RUNNING, COMPLETED, FAILED
+    filename: Optional[str] = None
+    recipients_file_sha256: str
+    total_rows: int = 0
+    processed_rows: int = 0
+    imported: int = 0
+    skipped: int = 0
+    issues: List[RowIssue] = []  # Informe de filas descartadas (limitado)
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @property
+    def progress(self) -> float:
+        """Fracción de filas procesadas (0 a 1)."""
+        if self.status == "COMPLETED":
+            return 1.0
+        return self.processed_rows / self.total_rows if self.total_rows else 0.0
+
+    class Settings:
+        name = "import_jobs"
@@ -1,6 +1,6 @@
 # app/models/plan_model.py
 
-from beanie import Document
+from beanie import Document, Indexed
 from pydantic import Field
 from datetime import datetime
 
@@ -9,7 +9,7 @@ class Plan(Document):
     Modelo para los planes de suscripción.
     Cada instancia de esta clase representa un documento en la colección 'plans'.
     """
-    name: str
+    name: Indexed(str)
     max_campaigns: int
     max_recipients_per_campaign: int
     created_at: datetime = Field(default_factory=datetime.utcnow)
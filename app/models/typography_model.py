@@ -1,13 +1,15 @@
 # app/models/typography_model.py
 
-from beanie import Document
+from beanie import Document, Indexed
 
-class Typography(Document):
+from app.core.read_preference import ReadPreferenceMixin
+
+class Typography(ReadPreferenceMixin, Document):
     """
     Modelo para las tipografías.
     Cada documento representa una fuente disponible para los certificados.
     """
-    name: str
+    name: Indexed(str, unique=True)
     font_file_url: str
 
     class Settings:
@@ -3,7 +3,7 @@
 from pydantic import BaseModel, Field
 from beanie import PydanticObjectId
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 # --- Importamos las clases de sub-documentos que ya definimos ---
 
@@ -29,8 +29,15 @@ class CampaignDisplay(BaseModel):
     name: str
     status: str
     template_image_url: Optional[str] = None
+    template_width: Optional[int] = None
+    template_height: Optional[int] = None
+    template_derivatives: Dict[str, str] = {}
     config: Campaign.ConfigSettings
     email: Campaign.EmailSettings
+    # Con valor por defecto, como en el modelo: las campañas anteriores a
+    # estos campos no los tienen en la base de datos
+    output: Campaign.OutputSettings = Field(default_factory=Campaign.OutputSettings)
+    stats: Campaign.StatsCounters = Field(default_factory=Campaign.StatsCounters)
     # recipients: List[Recipient] = []  <-- Oculto por seguridad/rendimiento
     created_at: datetime
     updated_at: datetime
@@ -38,3 +45,49 @@ class CampaignDisplay(BaseModel):
     class Config:
         from_attributes = True
 
+
+# --- Proyección para el LISTADO de campañas ---
+class CampaignSummary(CampaignDisplay):
+    """
+    Proyección de Campaign para los listados: Beanie pide a MongoDB solo los
+    campos de CampaignDisplay, así que el array de destinatarios no se lee.
+    """
+    id: PydanticObjectId = Field(alias="_id")
+
+
+class CampaignStats(BaseModel):
+    """Proyección con solo los contadores de la campaña."""
+    stats: Campaign.StatsCounters = Field(default_factory=Campaign.StatsCounters)
+
+
+class CampaignImportState(CampaignStats):
+    """
+    Proyección para las importaciones: el archivo de destinatarios actual y
+    los contadores, sin leer el array de destinatarios.
+    """
+    id: PydanticObjectId = Field(alias="_id")
+    recipients_file_url: Optional[str] = None
+    recipients_file_sha256: Optional[str] = None
+
+
+# --- Esquemas para el LISTADO paginado de destinatarios ---
+class RecipientDisplay(BaseModel):
+    """
+    Un destinatario tal como se muestra al organizador de la campaña.
+    """
+    name: str
+    email: str
+    unique_code: str
+    email_status: str
+    certificate_url: Optional[str] = None
+    claimed_at: Optional[datetime] = None
+    fields: Dict[str, str] = {}
+
+
+class RecipientPage(BaseModel):
+    """
+    Una página de destinatarios. 'next_cursor' se envía como 'cursor' para
+    pedir la siguiente página; es None en la última.
+    """
+    items: List[RecipientDisplay]
+    next_cursor: Optional[str] = None
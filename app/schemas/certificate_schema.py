@@ -1,9 +1,19 @@
 # app/schemas/certificate_schema.py
 
 from pydantic import BaseModel
+from typing import Any, Dict
 
 class CertificateClaimRequest(BaseModel):
     unique_code: str
 
 class CertificateClaimResponse(BaseModel):
-    certificate_url: str
\ No newline at end of file
+    certificate_url: str
+
+class OutputFormatBenchmark(BaseModel):
+    """
+    Resultado del benchmark de un formato de salida sobre la plantilla de una campaña.
+    """
+    format: str
+    options: Dict[str, Any]
+    encode_ms: float
+    size_bytes: int
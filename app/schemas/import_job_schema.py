@@ -0,0 +1,31 @@
+# app/schemas/import_job_schema.py
+
+from pydantic import BaseModel
+from beanie import PydanticObjectId
+from datetime import datetime
+from typing import List, Optional
+
+from app.models.import_job_model import RowIssue
+
+class ImportJobDisplay(BaseModel):
+    """
+    Estado de una importación de destinatarios en segundo plano.
+    'progress' va de 0 a 1 y 'issues' lista las filas descartadas.
+    """
+    id: PydanticObjectId
+    campaign_id: PydanticObjectId
+    status: str
+    filename: Optional[str] = None
+    total_rows: int
+    processed_rows: int
+    progress: float
+    imported: int
+    skipped: int
+    issues: List[RowIssue] = []
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
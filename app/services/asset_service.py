@@ -0,0 +1,147 @@
+# app/services/asset_service.py
+
+from fastapi import HTTPException, status
+from beanie import UpdateResponse
+from datetime import datetime
+from pymongo.errors import DuplicateKeyError
+from typing import BinaryIO, Iterable, Optional, Union
+import asyncio
+import hashlib
+import time
+
+from app.models.asset_model import Asset
+from app.core.storage import storage
+from app.core.tracing import log_event
+
+# Carpeta común a todos los archivos: el nombre es el hash, no la campaña
+ASSETS_FOLDER = "assets"
+
+# Intentos de adquirir un asset que otra petición crea o borra a la vez
+ACQUIRE_ATTEMPTS = 3
+
+# Espera máxima a que termine el borrado de un asset antes de volver a
+# subirlo; pasado este tiempo el borrado se da por abandonado
+DELETE_WAIT_SECONDS = 10
+DELETE_POLL_SECONDS = 0.2
+
+
+def content_hash(data: bytes) -> str:
+    """Huella SHA-256 de un contenido."""
+    return hashlib.sha256(data).hexdigest()
+
+
+async def _add_reference(sha256: str) -> Optional[Asset]:
+    """
+    Suma una referencia en una sola operación atómica y devuelve el asset
+    actualizado, o None si no existe o se está borrando. Un asset liberado
+    (ref_count 0) que aún no se ha marcado para borrar se recupera, y
+    release_assets ya no lo borra.
+    """
+    return await Asset.find_one({"sha256": sha256, "deleting_at": None}).update(
+        {"$inc": {"ref_count": 1}}, response_type=UpdateResponse.NEW_DOCUMENT
+    )
+
+
+async def _wait_for_deletion(sha256: str):
+    """
+    Espera a que release_assets termine de borrar el asset con este hash. Si
+    tarda demasiado (el proceso que lo borraba murió), se elimina el documento
+    abandonado para que el contenido se pueda volver a subir.
+    """
+    deadline = time.monotonic() + DELETE_WAIT_SECONDS
+    while await Asset.find_one({"sha256": sha256, "deleting_at": {"$ne": None}}).count():
+        if time.monotonic() > deadline:
+            await Asset.find_one({"sha256": sha256, "deleting_at": {"$ne": None}}).delete()
+            return
+        await asyncio.sleep(DELETE_POLL_SECONDS)
+
+
+async def acquire_asset(
+    data: Union[bytes, BinaryIO],
+    resource_type: str = "image",
+    extension: str = "",
+    sha256: Optional[str] = None,
+    size: Optional[int] = None
+) -> Asset:
+    """
+    Devuelve el asset con este contenido sumándole una referencia.
+    Si el contenido ya estaba almacenado no se sube de nuevo; si no, se sube
+    una única vez con el hash como nombre, de modo que su URL es estable.
+    Para archivos abiertos (subidas ya leídas) se pasan su hash y su tamaño.
+
+    Si el asset se está borrando, se espera a que termine y se sube de nuevo:
+    la clave es la misma, así que subirlo antes haría que el borrado en curso
+    eliminase el archivo recién escrito.
+    """
+    if isinstance(data, bytes):
+        sha256, size = content_hash(data), len(data)
+    key = f"{ASSETS_FOLDER}/{sha256}{extension}"
+
+    for _ in range(ACQUIRE_ATTEMPTS):
+        asset = await _add_reference(sha256)
+        if asset:
+            return asset
+        await _wait_for_deletion(sha256)
+
+        if not isinstance(data, bytes):
+            data.seek(0)
+        try:
+            url = await storage.put(key, data, resource_type=resource_type)
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"No se pudo almacenar el archivo: {e}"
+            )
+
+        asset = Asset(
+            sha256=sha256,
+            url=url,
+            key=key,
+            resource_type=resource_type,
+            size=size,
+            ref_count=1,
+        )
+        try:
+            await asset.create()
+            return asset
+        except DuplicateKeyError:
+            # Otra petición lo ha creado (se reutiliza el suyo) o lo está
+            # borrando (se espera y se vuelve a subir): se reintenta
+            continue
+
+    raise HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="No se pudo almacenar el archivo. Inténtalo de nuevo."
+    )
+
+
+async def release_assets(urls: Iterable[Optional[str]]):
+    """
+    Resta una referencia a los assets con estas URLs. Los que se quedan sin
+    referencias se borran del almacenamiento. Las URLs que no son assets
+    (archivos subidos antes de existir este modelo) se ignoran.
+
+    El borrado se marca en el documento (deleting_at) antes de tocar el
+    almacenamiento: desde ese momento nadie puede sumarle referencias, y el
+    documento se elimina solo después de borrar el archivo.
+    """
+    for url in urls:
+        if not url:
+            continue
+        asset = await Asset.find_one({"url": url, "deleting_at": None}).update(
+            {"$inc": {"ref_count": -1}}, response_type=UpdateResponse.NEW_DOCUMENT
+        )
+        if not asset or asset.ref_count > 0:
+            continue
+
+        # Solo se borra si nadie lo ha vuelto a adquirir entretanto
+        marked = await Asset.find_one(
+            {"_id": asset.id, "ref_count": {"$lte": 0}, "deleting_at": None}
+        ).update({"$set": {"deleting_at": datetime.utcnow()}})
+        if not (marked and marked.modified_count):
+            continue
+        try:
+            await storage.delete(asset.key, resource_type=asset.resource_type)
+        except Exception as e:
+            log_event("asset_delete_failed", key=asset.key, error=str(e))
+        await Asset.find_one(Asset.id == asset.id).delete()
@@ -2,28 +2,26 @@
 from fastapi import HTTPException, status, UploadFile, BackgroundTasks, Form
 from beanie import PydanticObjectId
 from typing import List, Optional
-import cloudinary
-import cloudinary.uploader
 
-from app.models.campaign_model import Campaign,Recipient
+from app.models.campaign_model import Campaign, TextField
 from app.models.user_model import User
 from app.models.typography_model import Typography 
 from app.models.plan_model import Plan 
-from app.schemas.campaign_schema import CampaignCreate
+from app.schemas.campaign_schema import CampaignCreate, CampaignSummary
 from datetime import datetime
-from app.core.config import settings
-from app.services import email_service
-
-import pandas as pd
-import secrets
-import io
+from app.core.read_preference import secondary_reads
+from app.core.tracing import span
+from app.services import asset_service, email_service, image_service, import_service, upload_service
+from app.services.certificate_service import OUTPUT_FORMATS
+from pymongo import DESCENDING
+
+import asyncio
+import base64
 import json
 
-cloudinary.config(
-    cloud_name=settings.CLOUDINARY_CLOUD_NAME,
-    api_key=settings.CLOUDINARY_API_KEY,
-    api_secret=settings.CLOUDINARY_API_SECRET,
-)
+# Campañas por página cuando se pagina con 'cursor' sin indicar 'limit'
+CAMPAIGN_PAGE_SIZE = 50
+
 
 async def create_campaign(campaign_data: CampaignCreate, current_user: User) -> Campaign:
     """
@@ -94,11 +92,55 @@ async def create_campaign(campaign_data: CampaignCreate, current_user: User) ->
     
     return campaign
 
-async def get_campaigns_by_user(current_user: User) -> List[Campaign]:
+def _encode_list_cursor(campaign: CampaignSummary) -> str:
+    """Cursor opaco con la clave de orden (updated_at, _id) del último elemento."""
+    key = {"u": campaign.updated_at.isoformat(), "i": str(campaign.id)}
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def _decode_list_cursor(cursor: str) -> tuple[datetime, PydanticObjectId]:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(key["u"]), PydanticObjectId(key["i"])
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El cursor de paginación no es válido."
+        )
+
+
+@secondary_reads
+async def get_campaigns_by_user(
+    current_user: User,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None
+) -> tuple[List[CampaignSummary], Optional[str]]:
     """
-    Servicio para obtener todas las campañas de un usuario específico.
+    Servicio para obtener las campañas de un usuario, de la más reciente a la
+    más antigua, por páginas ('limit') o todas (sin 'limit'). Usa una
+    proyección sin destinatarios y el índice (user_id, updated_at, _id), así
+    que el coste no depende del tamaño de las campañas ni de la profundidad
+    de la página.
+    Devuelve la página y el cursor de la siguiente (None si es la última).
     """
-    return await Campaign.find(Campaign.user_id == current_user.id).to_list()
+    query = {"user_id": current_user.id}
+    if cursor:
+        updated_at, last_id = _decode_list_cursor(cursor)
+        query["$or"] = [
+            {"updated_at": {"$lt": updated_at}},
+            {"updated_at": updated_at, "_id": {"$lt": last_id}},
+        ]
+
+    with span("campaigns"):
+        campaigns = await Campaign.find(query).sort(
+            [("updated_at", DESCENDING), ("_id", DESCENDING)]
+        ).limit(limit + 1 if limit else 0).project(CampaignSummary).to_list()
+
+    next_cursor = None
+    if limit and len(campaigns) > limit:
+        campaigns = campaigns[:limit]
+        next_cursor = _encode_list_cursor(campaigns[-1])
+    return campaigns, next_cursor
 
 
 async def get_campaign_by_id(campaign_id: PydanticObjectId, current_user: User) -> Campaign:
@@ -106,7 +148,8 @@ async def get_campaign_by_id(campaign_id: PydanticObjectId, current_user: User)
     Servicio para obtener una campaña específica por su ID.
     Verifica que la campaña pertenezca al usuario actual.
     """
-    campaign = await Campaign.get(campaign_id)
+    with span("campaign"):
+        campaign = await Campaign.get(campaign_id)
 
     # Verificación de seguridad:
     # 1. ¿Existe la campaña?
@@ -131,6 +174,9 @@ async def delete_campaign(campaign_id: PydanticObjectId, current_user: User):
 
     # 2. Si la verificación es exitosa, eliminamos el documento.
     await campaign.delete()
+
+    # 3. Liberamos la plantilla y el Excel (se borran si ninguna otra campaña los usa)
+    await asset_service.release_assets([*template_asset_urls(campaign), campaign.recipients_file_url])
     
     # No es necesario devolver nada, el éxito se comunica con el código de estado HTTP.
     return
@@ -146,164 +192,280 @@ async def update_campaign_name(
     # 1. Obtener la campaña y verificar propiedad
     campaign = await get_campaign_by_id(campaign_id, current_user)
     
-    # 2. Actualizar el nombre
-    campaign.name = name
-    campaign.updated_at = datetime.utcnow()
-    
-    # 3. Guardar cambios
-    await campaign.save()
+    # 2. Actualizar el nombre con un $set: un save() completo pisaría los
+    # contadores y estados que el envío y las reclamaciones cambian a la vez
+    await _set_fields(campaign, {"name": name, "updated_at": datetime.utcnow()})
     
     return campaign
 
 
-async def upload_template_and_update_config_formdata(
-    campaign_id: PydanticObjectId,
-    file: UploadFile,
-    name_pos_x: int,
-    name_pos_y: int,
-    name_font_size: int,
-    name_color: str,
-    typography_id: str,
-    code_pos_x: Optional[int],
-    code_pos_y: Optional[int],
-    code_font_size: Optional[int],
-    code_color: Optional[str],
-    current_user: User
-) -> Campaign:
+async def _set_fields(campaign: Campaign, changes: dict):
     """
-    Servicio para subir una imagen de plantilla Y actualizar la configuración
-    de la campaña usando campos individuales de FormData.
-    Acepta el ID de la tipografía directamente.
+    Guarda solo los campos modificados con un $set, sin reescribir el
+    documento completo (y, con él, todo el array de destinatarios).
     """
-    # 1. Obtener la campaña y verificar la propiedad
-    campaign = await get_campaign_by_id(campaign_id, current_user)
+    for key, value in changes.items():
+        setattr(campaign, key, value)
+    await Campaign.find_one(Campaign.id == campaign.id).update({"$set": changes})
 
-    # 2. Convertir typography_id de string a PydanticObjectId
-    try:
-        typography_obj_id = PydanticObjectId(typography_id)
-    except Exception:
-        raise HTTPException(
-            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail="El typography_id proporcionado no es válido."
-        )
 
-    # 3. Crear el objeto ConfigSettings
+def _build_config(
+    current: Campaign.ConfigSettings,
+    config_updates: dict,
+    text_fields: Optional[str],
+    scale: float = 1.0
+) -> Campaign.ConfigSettings:
+    """
+    Aplica los campos de configuración enviados sobre la configuración actual.
+    'text_fields' es una lista JSON de campos de texto que sustituye a la actual.
+    Con 'scale' se escalan solo las coordenadas enviadas (relativas a una
+    plantilla que se ha reducido al normalizarla); las guardadas no cambian.
+    """
+    updates = dict(config_updates)
+
+    # Convertir typography_id de string a PydanticObjectId
+    if "typography_id" in updates:
+        try:
+            updates["typography_id"] = PydanticObjectId(updates["typography_id"])
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="El typography_id proporcionado no es válido."
+            )
+
     try:
-        config = Campaign.ConfigSettings(
-            name_pos_x=name_pos_x,
-            name_pos_y=name_pos_y,
-            name_font_size=name_font_size,
-            name_color=name_color,
-            typography_id=typography_obj_id,
-            code_pos_x=code_pos_x,
-            code_pos_y=code_pos_y,
-            code_font_size=code_font_size,
-            code_color=code_color
-        )
+        if text_fields is not None:
+            updates["text_fields"] = [TextField(**field) for field in json.loads(text_fields)]
+        if scale != 1.0:
+            for key in SCALED_CONFIG_KEYS:
+                if key in updates:
+                    updates[key] = _scaled(updates[key], scale)
+            if "text_fields" in updates:
+                updates["text_fields"] = [_scale_text_field(field, scale, only_set=True) for field in updates["text_fields"]]
+        return Campaign.ConfigSettings(**{**current.model_dump(), **updates})
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail=f"Error al procesar la configuración: {str(e)}"
         )
 
-    # 4. Subir el archivo a Cloudinary
-    upload_result = cloudinary.uploader.upload(
-        file.file, folder="certhub-api/{current_user.id}/{campaign_id}/certificate_templates"
-    )
 
-    # 5. Obtener la URL segura del resultado
-    secure_url = upload_result.get("secure_url")
-    if not secure_url:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="No se pudo subir la imagen a Cloudinary."
-        )
-    
-    # 6. Actualizar tanto la URL de la imagen como la configuración
-    campaign.template_image_url = secure_url
-    campaign.config = config
-    campaign.updated_at = datetime.utcnow()
-    await campaign.save()
+async def _upload_template(upload: upload_service.SpooledUpload) -> tuple[dict, float]:
+    """
+    Normaliza la plantilla (valida dimensiones, convierte el modo de color,
+    elimina metadatos, limita el tamaño y genera los derivados) y la almacena.
+    Devuelve los campos a actualizar y la escala aplicada al master.
+    """
+    with span("template_normalize"):
+        normalized = await asyncio.to_thread(image_service.normalize_template, upload.open())
+
+    # El master y los derivados se almacenan por contenido: si otra campaña
+    # ya usa la misma imagen, se reutiliza sin volver a subirla
+    with span("template_store"):
+        master = await asset_service.acquire_asset(normalized.master.data, extension=normalized.master.extension)
+        derivative_urls = {}
+        try:
+            for derivative_name, derivative in normalized.derivatives.items():
+                derivative_asset = await asset_service.acquire_asset(derivative.data, extension=derivative.extension)
+                derivative_urls[derivative_name] = derivative_asset.url
+        except Exception:
+            await asset_service.release_assets([master.url, *derivative_urls.values()])
+            raise
+
+    changes = {
+        "template_image_url": master.url,
+        "template_width": normalized.master.width,
+        "template_height": normalized.master.height,
+        "template_derivatives": derivative_urls,
+        "template_sha256": upload.sha256,
+    }
+    return changes, normalized.scale
+
+
+def template_asset_urls(campaign: Campaign) -> list[str]:
+    """URLs de la plantilla y sus derivados que referencia la campaña."""
+    return [campaign.template_image_url, *campaign.template_derivatives.values()]
+
+
+async def update_campaign_formdata(
+    campaign_id: PydanticObjectId,
+    current_user: User,
+    template_file: Optional[UploadFile] = None,
+    recipients_file: Optional[UploadFile] = None,
+    config_updates: Optional[dict] = None,
+    text_fields: Optional[str] = None,
+    email_subject: Optional[str] = None,
+    email_body: Optional[str] = None,
+    output_updates: Optional[dict] = None
+) -> Campaign:
+    """
+    Servicio para actualizar parcialmente una campaña desde FormData:
+    configuración, email, salida, plantilla y destinatarios.
+
+    Solo se modifica lo que se envía. La plantilla y el Excel se identifican
+    por su hash: si se vuelve a enviar el mismo archivo no se sube ni se
+    procesa de nuevo. Todos los cambios se guardan en una única escritura
+    que solo toca los campos modificados.
+    """
+    # 1. Obtener la campaña y verificar la propiedad
+    campaign = await get_campaign_by_id(campaign_id, current_user)
+    config_updates = {k: v for k, v in (config_updates or {}).items() if v is not None}
+    output_updates = {k: v for k, v in (output_updates or {}).items() if v is not None}
+    changes = {}
+    replaced_urls = []  # Assets que la campaña deja de referenciar
+
+    # 2. Configuración
+    config = campaign.config
+    if config_updates or text_fields is not None:
+        config = _build_config(campaign.config, config_updates, text_fields)
+
+    # Los assets adquiridos en los pasos 3 y 6 se liberan si un paso posterior
+    # falla (p. ej. un Excel no válido), para no dejarlos sin referencia
+    acquired_urls = []
+    try:
+        # 3. Plantilla, solo si el contenido ha cambiado
+        if template_file is not None:
+            with await upload_service.read_upload(template_file, "template") as upload:
+                if upload.sha256 != campaign.template_sha256:
+                    template_changes, scale = await _upload_template(upload)
+                    changes.update(template_changes)
+                    acquired_urls.extend([template_changes["template_image_url"], *template_changes["template_derivatives"].values()])
+                    replaced_urls.extend(template_asset_urls(campaign))
+
+                    # Si el master se ha reducido, las coordenadas enviadas junto a la
+                    # imagen (relativas a la imagen subida) se escalan igual
+                    if scale != 1.0 and (config_updates or text_fields is not None):
+                        config = _build_config(campaign.config, config_updates, text_fields, scale)
+
+        if config != campaign.config:
+            changes["config"] = config
+
+        # 4. Email
+        if email_subject is not None or email_body is not None:
+            email = Campaign.EmailSettings(
+                subject=email_subject if email_subject is not None else campaign.email.subject,
+                body=email_body if email_body is not None else campaign.email.body
+            )
+            if email != campaign.email:
+                changes["email"] = email
+
+        # 5. Salida
+        if output_updates:
+            output = build_output_settings(current=campaign.output, **output_updates)
+            if output != campaign.output:
+                changes["output"] = output
+
+        # 6. Destinatarios, solo si el archivo ha cambiado
+        if recipients_file is not None:
+            recipients_changes = await _read_recipients_file(campaign, recipients_file, current_user)
+            if recipients_changes:
+                changes.update(recipients_changes)
+                acquired_urls.append(recipients_changes["recipients_file_url"])
+                replaced_urls.append(campaign.recipients_file_url)
+
+        # 7. Una única escritura con los campos modificados
+        if changes:
+            changes["updated_at"] = datetime.utcnow()
+            if "recipients" in changes:
+                await import_service.save_with_unique_codes(
+                    lambda: _set_fields(campaign, changes), changes["recipients"]
+                )
+            else:
+                await _set_fields(campaign, changes)
+    except Exception:
+        await asset_service.release_assets(acquired_urls)
+        raise
+
+    # 8. Liberar los archivos anteriores una vez guardadas las nuevas referencias
+    await asset_service.release_assets(replaced_urls)
 
     return campaign
 
 
-async def process_recipients_file(
-    campaign_id: PydanticObjectId,
-    file: UploadFile,
-    current_user: User
-) -> Campaign:
+# Coordenadas y tamaños (en píxeles de la plantilla) que se escalan con ella
+SCALED_CONFIG_KEYS = ("name_pos_x", "name_pos_y", "name_font_size", "code_pos_x", "code_pos_y", "code_font_size")
+SCALED_TEXT_FIELD_KEYS = ("pos_x", "pos_y", "font_size", "max_width", "min_font_size")
+
+
+def _scaled(value: Optional[int], scale: float) -> Optional[int]:
+    return None if value is None else max(1, round(value * scale))
+
+
+def _scale_text_field(field: TextField, scale: float, only_set: bool = False) -> TextField:
+    """Con 'only_set' no se escalan los valores por defecto, solo los enviados."""
+    keys = [key for key in SCALED_TEXT_FIELD_KEYS if not only_set or key in field.model_fields_set]
+    return field.model_copy(update={key: _scaled(getattr(field, key), scale) for key in keys})
+
+
+def scale_config(config: Campaign.ConfigSettings, scale: float) -> Campaign.ConfigSettings:
     """
-    Servicio para subir y procesar el archivo de destinatarios (Excel).
+    Escala posiciones, anchos y tamaños de fuente de toda la configuración
+    (p. ej. para dibujar sobre una versión reducida de la plantilla).
     """
-    # 1. Obtiene la campaña y verifica la propiedad del usuario
-    campaign = await get_campaign_by_id(campaign_id, current_user)
+    return config.model_copy(update={
+        **{key: _scaled(getattr(config, key), scale) for key in SCALED_CONFIG_KEYS},
+        "text_fields": [_scale_text_field(field, scale) for field in config.text_fields],
+    })
+
+
+def build_output_settings(
+    current: Campaign.OutputSettings,
+    output_format: Optional[str] = None,
+    png_compress_level: Optional[int] = None,
+    jpeg_quality: Optional[int] = None,
+    webp_quality: Optional[int] = None,
+    webp_lossless: Optional[bool] = None
+) -> Campaign.OutputSettings:
+    """
+    Aplica y valida los ajustes de salida de los certificados.
+    Los campos no enviados conservan su valor actual.
+    """
+    updates = {
+        "png_compress_level": png_compress_level,
+        "jpeg_quality": jpeg_quality,
+        "webp_quality": webp_quality,
+        "webp_lossless": webp_lossless,
+    }
+    if output_format is not None:
+        output_format = output_format.strip().upper()
+        if output_format == "JPG":
+            output_format = "JPEG"
+        if output_format not in OUTPUT_FORMATS:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Formato de salida no soportado. Usa uno de: {', '.join(OUTPUT_FORMATS)}."
+            )
+        updates["format"] = output_format
 
-    # 2. Lee el archivo Excel usando pandas
     try:
-        # Usamos un buffer de BytesIO para que pandas pueda leer el archivo en memoria
-        contents = await file.read()
-        buffer = io.BytesIO(contents)
-        df = pd.read_excel(buffer)
-        
-        # Normaliza los nombres de las columnas a minúsculas y sin espacios (¡buena práctica de tu código!)
-        df.columns = [str(col).strip().lower() for col in df.columns]
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail=f"No se pudo procesar el archivo. Asegúrate de que es un Excel válido. Error: {e}"
+        return Campaign.OutputSettings(
+            **{**current.model_dump(), **{k: v for k, v in updates.items() if v is not None}}
         )
-
-    # 3. Valida que las columnas 'nombre' y 'correo' existan
-    required_columns = {'nombre', 'correo'}
-    if not required_columns.issubset(df.columns):
+    except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail="El archivo Excel debe contener las columnas 'nombre' y 'correo'."
-        )
-
-    # 4. Verifica que el número de destinatarios no exceda el límite del plan
-    user_plan = await Plan.get(current_user.plan_id)
-    if not user_plan:
-        raise HTTPException(status_code=403, detail="Plan de usuario no encontrado.")
-    
-    if len(df) > user_plan.max_recipients_per_campaign:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"El número de destinatarios ({len(df)}) excede el límite de tu plan ({user_plan.max_recipients_per_campaign})."
+            detail=f"Error al procesar los ajustes de salida: {str(e)}"
         )
-    
-    # 5. Procesa cada fila para crear la lista de objetos Recipient
-    recipients_list: List[Recipient] = []
-    for index, row in df.iterrows():
-        name = row.get('nombre')
-        email = row.get('correo')
 
-        # Si falta nombre o email en una fila, la ignoramos para evitar errores
-        if pd.isna(name) or pd.isna(email) or name.strip() == "" or email.strip() == "":
-            continue
 
-        # Genera un código único de 8 caracteres alfanuméricos en mayúsculas
-        unique_code = secrets.token_hex(4).upper()
-
-        recipients_list.append(
-            Recipient(name=str(name), email=str(email), unique_code=unique_code)
-        )
-    
-    # 6. Sube el archivo original a Cloudinary para tener un respaldo
-    upload_result = cloudinary.uploader.upload(
-        contents,
-        folder="certhub-api/{current_user.id}/{campaign_id}/recipient_files",
-        resource_type="raw" # Importante para archivos no-media como Excel
-    )
-    
-    # 7. Actualiza el documento de la campaña con la nueva lista y la URL del archivo
-    campaign.recipients = recipients_list
-    campaign.recipients_file_url = upload_result.get("secure_url")
-    campaign.updated_at = datetime.utcnow() # Actualiza la fecha de modificación
-    await campaign.save()
+async def _read_recipients_file(
+    campaign: Campaign,
+    file: UploadFile,
+    current_user: User
+) -> dict:
+    """
+    Procesa el archivo de destinatarios (Excel) y lo sube como respaldo.
+    Devuelve los campos a actualizar; vacío si el archivo es idéntico al actual,
+    para no regenerar los códigos ya enviados. Para Excel muy grandes, usar la
+    importación en segundo plano (import_service.start_import_job).
+    """
+    with await upload_service.read_upload(file, "recipients") as upload:
+        if upload.sha256 == campaign.recipients_file_sha256:
+            return {}
+        max_recipients = await import_service.get_max_recipients(current_user)
+        changes, _ = await import_service.import_recipients(upload, max_recipients)
+        return changes
 
-    return campaign
 
 async def activate_campaign(campaign_id: PydanticObjectId, background_tasks: BackgroundTasks, current_user: User):
     """
@@ -317,9 +479,8 @@ async def activate_campaign(campaign_id: PydanticObjectId, background_tasks: Bac
     if not campaign.recipients:
         raise HTTPException(status_code=400, detail="La campaña no tiene destinatarios. Sube el archivo Excel primero.")
     
-    # Actualiza el estado de la campaña
-    campaign.status = "SENDING"
-    await campaign.save()
+    # Actualiza el estado de la campaña (solo ese campo, ver _set_fields)
+    await _set_fields(campaign, {"status": "SENDING", "updated_at": datetime.utcnow()})
 
     # Añade la tarea de envío de correos para que se ejecute en segundo plano
     background_tasks.add_task(email_service.send_emails_in_background, campaign)
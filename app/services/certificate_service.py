@@ -2,23 +2,175 @@
 
 from fastapi import HTTPException, status
 from fastapi.responses import StreamingResponse
-from PIL import Image, ImageDraw, ImageFont
-import requests
+from PIL import Image
+from collections import deque
+from functools import partial
+from typing import Callable
+import asyncio
 import io
-import cloudinary
-import cloudinary.uploader
+import re
+import time
+import zipfile
 from datetime import datetime
 
-from app.models.campaign_model import Campaign
+from app.models.campaign_model import Campaign, Recipient
 from app.models.typography_model import Typography
+from app.core import metrics
+from app.core.tracing import log_event, span
+from app.core.read_preference import secondary_reads
+from app.core.storage import storage
+from app.services import pdf_service, recipient_service, render_service
 
-async def generate_certificate_for_code(unique_code: str) -> StreamingResponse:
+# Número máximo de certificados renderizándose (o descargándose) a la vez
+# durante la descarga en ZIP. Limita también la memoria: solo hay este
+# número de entradas en vuelo.
+ZIP_RENDER_CONCURRENCY = 4
+
+# Formatos de salida soportados: (media type, extensión)
+OUTPUT_FORMATS = {
+    "PNG": ("image/png", "png"),
+    "JPEG": ("image/jpeg", "jpg"),
+    "WEBP": ("image/webp", "webp"),
+    "PDF": ("application/pdf", "pdf"),
+}
+
+
+def download_file(url: str) -> bytes:
+    """Lee un archivo almacenado (o remoto) y devuelve su contenido. Bloqueante."""
+    with span("fetch", metrics.RENDER_FETCH_SECONDS):
+        return storage.fetch(url)
+
+
+def encode_image(image: Image.Image, output_format: str, output: Campaign.OutputSettings) -> bytes:
+    """Codifica un certificado raster con los ajustes de salida de la campaña."""
+    with span("encode", metrics.RENDER_ENCODE_SECONDS):
+        return _encode_image(image, output_format, output)
+
+
+def _encode_image(image: Image.Image, output_format: str, output: Campaign.OutputSettings) -> bytes:
+    buffer = io.BytesIO()
+    if output_format == "JPEG":
+        # JPEG no admite transparencia: se aplana sobre blanco
+        if image.mode in ("RGBA", "LA", "P"):
+            rgba = image.convert("RGBA")
+            flattened = Image.new("RGB", rgba.size, "white")
+            flattened.paste(rgba, mask=rgba.getchannel("A"))
+            image = flattened
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        image.save(buffer, format="JPEG", quality=output.jpeg_quality, optimize=True)
+    elif output_format == "WEBP":
+        if output.webp_lossless:
+            image.save(buffer, format="WEBP", lossless=True)
+        else:
+            image.save(buffer, format="WEBP", quality=output.webp_quality)
+    else:
+        image.save(buffer, format="PNG", compress_level=output.png_compress_level)
+    return buffer.getvalue()
+
+
+def render_certificate_image(
+    plan: render_service.RenderPlan,
+    template_image: Image.Image,
+    output_format: str,
+    output: Campaign.OutputSettings,
+    values: dict[str, str]
+) -> bytes:
+    """Dibuja un certificado con el plan compilado y lo codifica en el formato raster indicado."""
+    with span("draw", metrics.RENDER_DRAW_SECONDS):
+        image = plan.draw(template_image, values)
+    return encode_image(image, output_format, output)
+
+
+def build_renderer(
+    campaign: Campaign,
+    font_url: str,
+    output_format: str | None = None
+) -> tuple[Callable[[dict[str, str]], bytes], str, str]:
+    """
+    Prepara el render según el formato de salida (por defecto, el de la campaña).
+    Devuelve (render(valores del destinatario) -> bytes, media type, extensión).
+    Hace E/S de red la primera vez, así que debe llamarse desde un hilo en
+    contextos async.
+    """
+    output_format = output_format or campaign.output.format
+    media_type, extension = OUTPUT_FORMATS[output_format]
+    template_url = campaign.template_image_url
+
+    # Plan compilado y cacheado por campaña: fuentes cargadas y anclas resueltas
+    plan = render_service.get_render_plan(campaign, font_url, download_file)
+
+    if output_format == "PDF":
+        # La plantilla y la fuente se codifican una vez y quedan en caché por campaña
+        pdf_service.get_template_stream(template_url, download_file)
+        pdf_service.get_font_streams(font_url, download_file)
+        render = partial(pdf_service.render_certificate_pdf, template_url, font_url, download_file, plan)
+    else:
+        template_image = plan.template_image(download_file)
+        render = partial(render_certificate_image, plan, template_image, output_format, campaign.output)
+
+    return render, media_type, extension
+
+
+def negotiate_output_format(accept: str | None, default_format: str) -> str:
+    """
+    Elige el formato de salida a partir de la cabecera Accept.
+    Se respeta el formato configurado en la campaña siempre que el cliente lo
+    acepte; si no, se usa el formato soportado con mayor 'q'. Si ninguno es
+    aceptable se devuelve también el de la campaña.
+    """
+    if not accept:
+        return default_format
+
+    preferences: dict[str, float] = {}
+    for part in accept.split(","):
+        pieces = [p.strip() for p in part.split(";")]
+        media_range = pieces[0].lower()
+        if not media_range:
+            continue
+        quality = 1.0
+        for param in pieces[1:]:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        preferences[media_range] = quality
+
+    def quality_for(media_type: str) -> float:
+        if media_type in preferences:
+            return preferences[media_type]
+        wildcard = media_type.split("/")[0] + "/*"
+        if wildcard in preferences:
+            return preferences[wildcard]
+        return preferences.get("*/*", 0.0)
+
+    if quality_for(OUTPUT_FORMATS[default_format][0]) > 0:
+        return default_format
+
+    best_format, best_quality = default_format, 0.0
+    for output_format, (media_type, _) in OUTPUT_FORMATS.items():
+        quality = quality_for(media_type)
+        if quality > best_quality:
+            best_format, best_quality = output_format, quality
+    return best_format
+
+
+def certificate_filename(student_name: str, unique_code: str, extension: str = "png") -> str:
+    """Nombre de archivo de descarga de un certificado."""
+    safe_name = re.sub(r'[\\/:*?"<>|]', "", student_name).replace(' ', '_')
+    return f"certificado_{safe_name}_{unique_code}.{extension}"
+
+
+async def generate_certificate_for_code(unique_code: str, accept: str | None = None) -> StreamingResponse:
     """
     Servicio principal para generar un certificado a partir de un código único.
-    Devuelve el certificado como archivo para descarga directa.
+    Devuelve el certificado como archivo para descarga directa, en el formato
+    de la campaña o en el negociado con la cabecera Accept.
     """
     # 1. Busca la campaña que contiene al destinatario con este código.
-    campaign = await Campaign.find_one({"recipients.unique_code": unique_code})
+    with span("campaign"):
+        campaign = await Campaign.find_one({"recipients.unique_code": unique_code})
     
     if not campaign:
         raise HTTPException(status_code=404, detail="Código de certificado no válido.")
@@ -39,88 +191,248 @@ async def generate_certificate_for_code(unique_code: str) -> StreamingResponse:
     if not config:
         raise HTTPException(status_code=500, detail="La campaña no tiene configuración.")
         
-    typography = await Typography.get(config.typography_id)
+    with span("typography"):
+        typography = await Typography.get(config.typography_id)
     if not typography:
         raise HTTPException(status_code=500, detail="La fuente configurada para esta campaña no fue encontrada.")
     font_url = typography.font_file_url
 
-    # 4. Proceso de Generación de Imagen en Memoria
+    # 4. Proceso de Generación del certificado en Memoria
     try:
-        # Descarga la plantilla y la fuente
-        template_response = requests.get(template_url)
-        template_response.raise_for_status()
-        font_response = requests.get(font_url)
-        font_response.raise_for_status()
-
-        # Abre los archivos desde la memoria
-        template_image = Image.open(io.BytesIO(template_response.content))
-        font_bytes = io.BytesIO(font_response.content)
-        
-        # Prepara para dibujar
-        draw = ImageDraw.Draw(template_image)
-        
-        # Dibuja el nombre del estudiante usando la configuración
-        name_font = ImageFont.truetype(font_bytes, config.name_font_size)
-        draw.text(
-            (config.name_pos_x, config.name_pos_y),
-            student_name,
-            font=name_font,
-            fill=config.name_color  # Usa el color de la configuración
-        )
-        
-        # Dibuja el código único si está configurado
-        if config.code_pos_x is not None and config.code_pos_y is not None:
-            # Usa el tamaño y color de fuente configurados para el código
-            code_font_size = config.code_font_size if config.code_font_size else 30
-            code_color = config.code_color if config.code_color else "#000000"
-            
-            # Necesitamos recargar el font_bytes porque truetype lo consume
-            font_bytes.seek(0)
-            code_font = ImageFont.truetype(font_bytes, code_font_size)
-            
-            draw.text(
-                (config.code_pos_x, config.code_pos_y),
-                unique_code,
-                font=code_font,
-                fill=code_color
-            )
-        
-        # Guarda la imagen final en un buffer de memoria, en formato PNG
-        final_image_buffer = io.BytesIO()
-        template_image.save(final_image_buffer, format="PNG")
-        final_image_buffer.seek(0)
+        # Descarga la plantilla y la fuente (o las toma de la caché en modo PDF)
+        output_format = negotiate_output_format(accept, campaign.output.format)
+        with span("prepare"):
+            render, media_type, extension = await asyncio.to_thread(build_renderer, campaign, font_url, output_format)
+
+        # Dibuja el certificado (en un hilo) y lo guarda en un buffer de memoria
+        with span("render"):
+            final_image_buffer = io.BytesIO(await asyncio.to_thread(render, render_service.recipient_values(recipient)))
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error durante la generación de la imagen: {e}")
 
-    # 5. Sube el certificado generado a Cloudinary (opcional, para respaldo)
+    # 5. Guarda el certificado generado (opcional, para respaldo)
     try:
-        # Necesitamos hacer una copia del buffer porque upload lo consume
-        buffer_copy = io.BytesIO(final_image_buffer.getvalue())
-        upload_result = cloudinary.uploader.upload(
-            buffer_copy, 
-            folder=f"certhub-api/generated_certificates/{campaign.id}"
-        )
-        certificate_url = upload_result.get("secure_url")
+        with span("upload", metrics.RENDER_UPLOAD_SECONDS):
+            certificate_url = await storage.put(
+                f"generated_certificates/{campaign.id}/{unique_code}.{extension}",
+                final_image_buffer.getvalue()
+            )
         
-        # Actualiza el documento del destinatario con la URL y fecha
-        recipient.certificate_url = certificate_url
-        recipient.claimed_at = datetime.utcnow()
-        await campaign.save()
+        # Actualiza el destinatario con la URL y la fecha (y el contador de reclamados)
+        with span("mark_claimed"):
+            await recipient_service.mark_claimed(campaign.id, unique_code, certificate_url)
     except Exception as e:
-        # Si falla la subida a Cloudinary, continuamos igual
-        print(f"Error al subir a Cloudinary: {e}")
+        # Si falla la subida, continuamos igual
+        log_event("certificate_save_failed", campaign_id=str(campaign.id), unique_code=unique_code, error=str(e))
 
     # 6. Devuelve el certificado como archivo para descarga directa
     final_image_buffer.seek(0)
     
     # Nombre del archivo para descarga
-    filename = f"certificado_{student_name.replace(' ', '_')}_{unique_code}.png"
+    filename = certificate_filename(student_name, unique_code, extension)
     
     return StreamingResponse(
         final_image_buffer,
-        media_type="image/png",
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Vary": "Accept"
+        }
+    )
+
+
+def _benchmark_formats(campaign: Campaign, font_url: str) -> list[dict]:
+    """
+    Dibuja un certificado de ejemplo sobre la plantilla real de la campaña y
+    mide el tiempo de codificación y el tamaño resultante de cada formato.
+    """
+    plan = render_service.get_render_plan(campaign, font_url, download_file)
+    values = render_service.sample_values(campaign.config)
+    image = plan.draw(plan.template_image(download_file), values)
+    current = campaign.output
+
+    variants = [
+        ("PNG", {"png_compress_level": 1}),
+        ("PNG", {"png_compress_level": 6}),
+        ("PNG", {"png_compress_level": 9}),
+        ("JPEG", {"jpeg_quality": current.jpeg_quality}),
+        ("WEBP", {"webp_quality": current.webp_quality, "webp_lossless": False}),
+        ("WEBP", {"webp_lossless": True}),
+    ]
+
+    results = []
+    for output_format, options in variants:
+        settings = current.model_copy(update=options)
+        started = time.perf_counter()
+        data = encode_image(image, output_format, settings)
+        elapsed = time.perf_counter() - started
+        results.append({
+            "format": output_format,
+            "options": options,
+            "encode_ms": round(elapsed * 1000, 2),
+            "size_bytes": len(data),
+        })
+
+    # PDF: se mide el coste por certificado, con la plantilla ya en caché
+    pdf_service.get_template_stream(campaign.template_image_url, download_file)
+    pdf_service.get_font_streams(font_url, download_file)
+    started = time.perf_counter()
+    data = pdf_service.render_certificate_pdf(
+        campaign.template_image_url, font_url, download_file, plan, values
+    )
+    elapsed = time.perf_counter() - started
+    results.append({
+        "format": "PDF",
+        "options": {},
+        "encode_ms": round(elapsed * 1000, 2),
+        "size_bytes": len(data),
+    })
+    return results
+
+
+@secondary_reads
+async def benchmark_output_formats(campaign: Campaign) -> list[dict]:
+    """
+    Servicio que compara los formatos de salida sobre la plantilla de la campaña,
+    para poder elegir con datos entre CPU y ancho de banda.
+    """
+    if not campaign.template_image_url:
+        raise HTTPException(status_code=400, detail="La campaña no tiene una plantilla de imagen configurada.")
+
+    typography = await Typography.get(campaign.config.typography_id)
+    if not typography:
+        raise HTTPException(status_code=500, detail="La fuente configurada para esta campaña no fue encontrada.")
+
+    try:
+        return await asyncio.to_thread(_benchmark_formats, campaign, typography.font_file_url)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error durante el benchmark: {e}")
+
+
+class _ZipChunkWriter:
+    """
+    Destino de escritura para zipfile que no admite seek.
+    zipfile escribe entonces cada entrada con 'data descriptor', de modo que
+    el ZIP se puede ir enviando a medida que se completan las entradas.
+    """
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._offset = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        """Devuelve y descarta todo lo escrito desde el último drenado."""
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _render_or_fetch(
+    render: Callable[[dict[str, str]], bytes],
+    extension: str,
+    recipient: Recipient
+) -> bytes:
+    """
+    Reutiliza el certificado ya guardado si existe y está en el formato
+    actual; si no (o si falla la descarga), lo renderiza. Se ejecuta en un hilo.
+    """
+    certificate_url = recipient.certificate_url
+    if certificate_url and certificate_url.lower().endswith(f".{extension}"):
+        try:
+            return download_file(certificate_url)
+        except Exception as e:
+            # to_thread copia el contexto: la línea lleva el id de la petición
+            log_event("certificate_reuse_failed", unique_code=recipient.unique_code, error=str(e))
+    return render(render_service.recipient_values(recipient))
+
+
+@secondary_reads
+async def stream_campaign_certificates_zip(campaign: Campaign) -> StreamingResponse:
+    """
+    Servicio para descargar todos los certificados de una campaña en un ZIP.
+    El ZIP se genera y envía de forma incremental, sin archivos temporales:
+    los certificados se renderizan en paralelo (hasta ZIP_RENDER_CONCURRENCY
+    a la vez) y se escriben en el orden de la lista de destinatarios.
+    La propiedad de la campaña debe haberse verificado antes.
+    """
+    if not campaign.recipients:
+        raise HTTPException(status_code=400, detail="La campaña no tiene destinatarios.")
+    if not campaign.template_image_url:
+        raise HTTPException(status_code=400, detail="La campaña no tiene una plantilla de imagen configurada.")
+
+    typography = await Typography.get(campaign.config.typography_id)
+    if not typography:
+        raise HTTPException(status_code=500, detail="La fuente configurada para esta campaña no fue encontrada.")
+
+    # La plantilla y la fuente se descargan una sola vez para todo el ZIP,
+    # antes de empezar la respuesta para poder devolver un error limpio.
+    try:
+        render, _, extension = await asyncio.to_thread(build_renderer, campaign, typography.font_file_url)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al descargar la plantilla o la fuente: {e}")
+
+    recipients = list(campaign.recipients)
+
+    async def zip_stream():
+        writer = _ZipChunkWriter()
+        pending = deque()
+        recipient_iter = iter(recipients)
+
+        def schedule_next() -> bool:
+            recipient = next(recipient_iter, None)
+            if recipient is None:
+                return False
+            task = asyncio.ensure_future(asyncio.to_thread(
+                _render_or_fetch,
+                render,
+                extension,
+                recipient
+            ))
+            pending.append((recipient, task))
+            return True
+
+        try:
+            with zipfile.ZipFile(writer, mode="w", compression=zipfile.ZIP_STORED) as archive:
+                while len(pending) < ZIP_RENDER_CONCURRENCY and schedule_next():
+                    pass
+
+                while pending:
+                    recipient, task = pending.popleft()
+                    data = await task
+                    schedule_next()
+
+                    # Los certificados ya están comprimidos: se guardan sin recomprimir
+                    archive.writestr(
+                        zipfile.ZipInfo(
+                            certificate_filename(recipient.name, recipient.unique_code, extension),
+                            date_time=datetime.utcnow().timetuple()[:6]
+                        ),
+                        data
+                    )
+                    yield writer.drain()
+
+            # Directorio central del ZIP
+            yield writer.drain()
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+    filename = f"certificados_{campaign.id}.zip"
+    return StreamingResponse(
+        zip_stream(),
+        media_type="application/zip",
         headers={
             "Content-Disposition": f'attachment; filename="{filename}"'
         }
-    )
\ No newline at end of file
+    )
@@ -1,17 +1,20 @@
 # app/services/email_service.py
 
-import os
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
 import asyncio
 
 from app.core.config import settings
+from app.core.metrics import EMAILS
 from app.models.campaign_model import Campaign
+from app.services import recipient_service
 
 async def send_emails_in_background(campaign: Campaign):
     """
     Función que se ejecuta en segundo plano para enviar los correos usando SendGrid.
     """
+    # El SDK de SendGrid se importa al primer envío, no al arrancar
+    from sendgrid import SendGridAPIClient
+    from sendgrid.helpers.mail import Mail
+
     print(f"--- INICIANDO ENVÍO DE CORREOS PARA CAMPAÑA: {campaign.name} --- y el API KEY ES: {settings.SENDGRID_API_KEY}")
     
     # URL a la que el estudiante irá para reclamar su certificado
@@ -27,6 +30,9 @@ async def send_emails_in_background(campaign: Campaign):
     <p><a href="{claim_url}">{claim_url}</a></p>
     """
 
+    sent_counter = EMAILS.labels(str(campaign.id), "sent")
+    failed_counter = EMAILS.labels(str(campaign.id), "failed")
+
     for recipient in campaign.recipients:
         # Combinamos el cuerpo del correo de la campaña con nuestra plantilla
         html_body = campaign.email.body.replace('\n', '<br>') + EMAIL_FIXED_TEMPLATE.format(
@@ -52,17 +58,18 @@ async def send_emails_in_background(campaign: Campaign):
             
             print(f"Correo enviado a {recipient.email}. Status: {response.status_code}")
             
-            # Actualizar estado del recipient (opcional, requeriría guardar en BD)
-            recipient.email_status = "SENT"
+            new_status = "SENT"
+            sent_counter.inc()
 
         except Exception as e:
             print(f"Error al enviar correo a {recipient.email}: {e}")
-            recipient.email_status = "FAILED"
+            new_status = "FAILED"
+            failed_counter.inc()
         
-        # Guardar el estado actualizado del recipient
-        # Nota: Esto guarda todo el documento de la campaña por cada iteración.
-        # Para optimizar, se podría guardar al final o por lotes, pero para seguridad se hace aquí.
-        await campaign.save()
+        # Guardar el estado del recipient y ajustar los contadores de la campaña
+        # en una única actualización atómica (sin reescribir todo el documento)
+        await recipient_service.set_email_status(campaign.id, recipient.unique_code, recipient.email_status, new_status)
+        recipient.email_status = new_status
 
         await asyncio.sleep(0.2) # Pequeña pausa para evitar rate limits síncronos
 
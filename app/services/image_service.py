@@ -0,0 +1,132 @@
+# app/services/image_service.py
+
+from fastapi import HTTPException, status
+from PIL import Image, ImageOps
+from dataclasses import dataclass, field
+from typing import BinaryIO
+import io
+
+# Límites de las plantillas subidas
+TEMPLATE_MIN_DIMENSION = 200      # Lado mínimo en px
+TEMPLATE_MAX_DIMENSION = 4000     # Lado máximo del master: lo que exceda se reduce
+TEMPLATE_MAX_PIXELS = 80_000_000  # Protección frente a "decompression bombs"
+
+# Derivados que se generan en cada subida: nombre -> lado mayor en px
+TEMPLATE_DERIVATIVES = {
+    "preview": 800,
+    "email": 1200,
+}
+
+MASTER_JPEG_QUALITY = 92
+DERIVATIVE_JPEG_QUALITY = 80
+
+
+@dataclass
+class EncodedImage:
+    data: bytes
+    format: str
+    width: int
+    height: int
+
+    @property
+    def extension(self) -> str:
+        return ".jpg" if self.format == "JPEG" else ".png"
+
+
+@dataclass
+class NormalizedTemplate:
+    """
+    Resultado de normalizar una plantilla: el master canónico, sus derivados
+    y el factor de escala aplicado respecto a la imagen subida (para poder
+    ajustar las coordenadas de la configuración).
+    """
+    master: EncodedImage
+    scale: float
+    derivatives: dict[str, EncodedImage] = field(default_factory=dict)
+
+
+def _to_efficient_mode(image: Image.Image) -> Image.Image:
+    """
+    Convierte la imagen a RGB, o a RGBA solo si tiene transparencia real.
+    Elimina CMYK, paletas, escalas de grises y modos de 16 bits, que obligarían
+    a convertir en cada render.
+    """
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or (
+        image.mode == "P" and "transparency" in image.info
+    )
+    if has_alpha:
+        image = image.convert("RGBA")
+        # Un canal alfa totalmente opaco no aporta nada
+        if image.getchannel("A").getextrema() == (255, 255):
+            image = image.convert("RGB")
+        return image
+    if image.mode == "RGB":
+        return image
+    return image.convert("RGB")
+
+
+def _encode(image: Image.Image, lossy: bool, quality: int) -> EncodedImage:
+    """
+    Codifica sin metadatos (EXIF, ICC, texto). Se usa JPEG cuando se admite
+    pérdida y la imagen no tiene transparencia; PNG en otro caso.
+    """
+    buffer = io.BytesIO()
+    if lossy and image.mode == "RGB":
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+        image_format = "JPEG"
+    else:
+        image.save(buffer, format="PNG", optimize=False)
+        image_format = "PNG"
+    return EncodedImage(buffer.getvalue(), image_format, image.width, image.height)
+
+
+def normalize_template(source: BinaryIO) -> NormalizedTemplate:
+    """
+    Valida y normaliza una plantilla subida: aplica la orientación EXIF,
+    convierte a un modo eficiente, reduce al tamaño máximo, elimina metadatos
+    y genera los derivados. Es CPU intensivo: llamar desde un hilo.
+    """
+    try:
+        image = Image.open(source)
+        if image.width * image.height > TEMPLATE_MAX_PIXELS:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"La imagen es demasiado grande ({image.width}x{image.height})."
+            )
+        source_format = image.format
+        image.load()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"No se pudo leer la imagen de la plantilla: {e}"
+        )
+
+    image = ImageOps.exif_transpose(image)
+
+    if min(image.size) < TEMPLATE_MIN_DIMENSION:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"La imagen es demasiado pequeña ({image.width}x{image.height}). "
+                   f"El lado mínimo es {TEMPLATE_MIN_DIMENSION}px."
+        )
+
+    image = _to_efficient_mode(image)
+
+    scale = 1.0
+    if max(image.size) > TEMPLATE_MAX_DIMENSION:
+        scale = TEMPLATE_MAX_DIMENSION / max(image.size)
+        new_size = (round(image.width * scale), round(image.height * scale))
+        image = image.resize(new_size, Image.Resampling.LANCZOS)
+
+    # Un JPEG de origen ya tiene pérdida: guardarlo como PNG solo lo haría más pesado
+    master = _encode(image, lossy=source_format == "JPEG", quality=MASTER_JPEG_QUALITY)
+
+    derivatives = {}
+    for name, max_side in TEMPLATE_DERIVATIVES.items():
+        derivative = image.copy()
+        derivative.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        derivatives[name] = _encode(derivative, lossy=True, quality=DERIVATIVE_JPEG_QUALITY)
+
+    return NormalizedTemplate(master=master, scale=scale, derivatives=derivatives)
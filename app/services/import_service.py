@@ -0,0 +1,332 @@
+# app/services/import_service.py
+
+from fastapi import HTTPException, status, UploadFile, BackgroundTasks
+from beanie import PydanticObjectId
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime
+from typing import TYPE_CHECKING, Awaitable, Callable, List, Optional
+import asyncio
+import secrets
+import time
+
+from app.core.metrics import IMPORT_JOB_SECONDS, IMPORT_ROWS
+from app.core.tracing import log_event
+from app.models.campaign_model import Campaign, Recipient
+from app.models.import_job_model import ImportJob, RowIssue
+from app.models.plan_model import Plan
+from app.models.user_model import User
+from app.schemas.campaign_schema import CampaignImportState
+from app.services import asset_service, recipient_service, upload_service
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Filas que se procesan entre dos actualizaciones del progreso
+IMPORT_BATCH_SIZE = 2000
+
+# Filas descartadas que se guardan en el informe del trabajo
+MAX_REPORTED_ISSUES = 1000
+
+REQUIRED_COLUMNS = {"nombre", "correo"}
+
+# Códigos de reclamación: 12 caracteres de un alfabeto sin caracteres
+# ambiguos (0/O, 1/I), 60 bits. Con token_hex(4) (32 bits) las colisiones
+# entre campañas eran probables a partir de unas decenas de miles de códigos
+CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+CODE_LENGTH = 12
+
+# Intentos de guardar los destinatarios si un código ya existe en otra campaña
+CODE_RETRIES = 3
+
+
+class ParsedRecipients:
+    """Resultado de procesar un Excel: destinatarios, filas descartadas y total de filas."""
+    def __init__(self, recipients: List[Recipient], issues: List[RowIssue], skipped: int, total_rows: int):
+        self.recipients = recipients
+        self.issues = issues
+        self.skipped = skipped
+        self.total_rows = total_rows
+
+
+def _read_sheet(source) -> "pd.DataFrame":
+    """Lee el Excel y normaliza las columnas. Bloqueante: llamar desde un hilo."""
+    # pandas (y numpy) se importan al procesar el primer Excel, no al arrancar
+    import pandas as pd
+
+    try:
+        df = pd.read_excel(source)
+        # Normaliza los nombres de las columnas a minúsculas y sin espacios
+        df.columns = [str(col).strip().lower() for col in df.columns]
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"No se pudo procesar el archivo. Asegúrate de que es un Excel válido. Error: {e}"
+        )
+
+    if not REQUIRED_COLUMNS.issubset(df.columns):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="El archivo Excel debe contener las columnas 'nombre' y 'correo'."
+        )
+    return df
+
+
+def _build_recipients(df: "pd.DataFrame", extra_columns: List[str]) -> tuple[List[Recipient], List[RowIssue]]:
+    """
+    Crea los destinatarios de un bloque de filas. Las columnas distintas de
+    nombre y correo se guardan como campos adicionales, para poder dibujarlas
+    en el certificado (curso, fecha, nota...). Bloqueante: llamar desde un hilo.
+    """
+    import pandas as pd
+
+    recipients, issues = [], []
+    for index, row in df.iterrows():
+        name = row.get('nombre')
+        email = row.get('correo')
+
+        # Si falta nombre o email en una fila, la ignoramos (y se informa)
+        if pd.isna(name) or pd.isna(email) or str(name).strip() == "" or str(email).strip() == "":
+            issues.append(RowIssue(row=index + 2, reason="Falta el nombre o el correo."))
+            continue
+
+        fields = {}
+        for col in extra_columns:
+            value = row.get(col)
+            if pd.isna(value):
+                continue
+            if isinstance(value, (pd.Timestamp, datetime)):
+                value = value.strftime("%d/%m/%Y")
+            fields[col] = str(value).strip()
+
+        recipients.append(
+            Recipient(name=str(name), email=str(email), unique_code=generate_code(), fields=fields)
+        )
+    return recipients, issues
+
+
+def generate_code() -> str:
+    """Código único de reclamación de un destinatario."""
+    return "".join(secrets.choice(CODE_ALPHABET) for _ in range(CODE_LENGTH))
+
+
+def dedupe_codes(recipients: List[Recipient], regenerate: bool = False):
+    """
+    Garantiza que los códigos no se repiten dentro de la campaña (el índice
+    único multikey no lo impide dentro de un mismo array). Con 'regenerate'
+    se asignan códigos nuevos a todos, para reintentar tras una colisión.
+    """
+    seen = set()
+    for recipient in recipients:
+        if regenerate:
+            recipient.unique_code = generate_code()
+        while recipient.unique_code in seen:
+            recipient.unique_code = generate_code()
+        seen.add(recipient.unique_code)
+
+
+async def save_with_unique_codes(save: Callable[[], Awaitable[None]], recipients: List[Recipient]):
+    """
+    Ejecuta la escritura de los destinatarios. Si algún código ya existe en
+    otra campaña (DuplicateKeyError del índice único), genera códigos nuevos
+    y reintenta. Los códigos aún no se han enviado, así que se pueden cambiar.
+    """
+    for attempt in range(CODE_RETRIES):
+        try:
+            return await save()
+        except DuplicateKeyError:
+            log_event("recipient_codes_collision", attempt=attempt + 1)
+            dedupe_codes(recipients, regenerate=True)
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="No se pudieron generar códigos únicos para los destinatarios. Inténtalo de nuevo."
+    )
+
+
+async def get_max_recipients(current_user: User) -> int:
+    """Límite de destinatarios por campaña del plan del usuario."""
+    user_plan = await Plan.get(current_user.plan_id)
+    if not user_plan:
+        raise HTTPException(status_code=403, detail="Plan de usuario no encontrado.")
+    return user_plan.max_recipients_per_campaign
+
+
+async def parse_recipients(
+    upload: upload_service.SpooledUpload,
+    max_recipients: int,
+    on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None
+) -> ParsedRecipients:
+    """
+    Procesa el Excel subido por bloques, fuera del event loop.
+    'on_progress(procesadas, total)' se llama después de cada bloque.
+    """
+    df = await asyncio.to_thread(_read_sheet, upload.open())
+    total_rows = len(df)
+
+    # Verifica que el número de destinatarios no exceda el límite del plan
+    if total_rows > max_recipients:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"El número de destinatarios ({total_rows}) excede el límite de tu plan ({max_recipients})."
+        )
+
+    extra_columns = [col for col in df.columns if col not in REQUIRED_COLUMNS]
+    recipients: List[Recipient] = []
+    issues: List[RowIssue] = []
+    skipped = 0
+    for start in range(0, total_rows, IMPORT_BATCH_SIZE):
+        batch = df.iloc[start:start + IMPORT_BATCH_SIZE]
+        batch_recipients, batch_issues = await asyncio.to_thread(_build_recipients, batch, extra_columns)
+        IMPORT_ROWS.labels("imported").inc(len(batch_recipients))
+        IMPORT_ROWS.labels("skipped").inc(len(batch_issues))
+        recipients.extend(batch_recipients)
+        skipped += len(batch_issues)
+        issues.extend(batch_issues[:MAX_REPORTED_ISSUES - len(issues)])
+        if on_progress:
+            await on_progress(start + len(batch), total_rows)
+
+    dedupe_codes(recipients)
+    return ParsedRecipients(recipients, issues, skipped, total_rows)
+
+
+async def import_recipients(
+    upload: upload_service.SpooledUpload,
+    max_recipients: int,
+    on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None
+) -> tuple[dict, ParsedRecipients]:
+    """
+    Procesa el Excel y guarda el archivo original como respaldo.
+    Devuelve los campos de la campaña a actualizar y el resultado del proceso.
+    """
+    parsed = await parse_recipients(upload, max_recipients, on_progress)
+
+    # "raw": el Excel no es una imagen
+    asset = await asset_service.acquire_asset(
+        upload.open(), resource_type="raw", extension=upload.extension, sha256=upload.sha256, size=upload.size
+    )
+    changes = {
+        "recipients": parsed.recipients,
+        "recipients_file_url": asset.url,
+        "recipients_file_sha256": upload.sha256,
+        "stats": recipient_service.initial_stats(len(parsed.recipients)),
+    }
+    return changes, parsed
+
+
+async def _set_job(job: ImportJob, changes: dict):
+    for key, value in changes.items():
+        setattr(job, key, value)
+    await ImportJob.find_one(ImportJob.id == job.id).update({"$set": changes})
+
+
+async def run_import_job(job: ImportJob, upload: upload_service.SpooledUpload, max_recipients: int):
+    """
+    Trabajo en segundo plano: procesa el Excel, actualiza la campaña y deja
+    en el trabajo el progreso y el informe final. Cierra la subida al terminar.
+    """
+    async def report_progress(processed_rows: int, total_rows: int):
+        await _set_job(job, {"processed_rows": processed_rows, "total_rows": total_rows})
+
+    started = time.perf_counter()
+    with upload:
+        try:
+            await _set_job(job, {"status": "RUNNING", "started_at": datetime.utcnow()})
+            changes, parsed = await import_recipients(upload, max_recipients, report_progress)
+
+            campaign = await Campaign.find_one(Campaign.id == job.campaign_id).project(CampaignImportState)
+            if not campaign:
+                await asset_service.release_assets([changes["recipients_file_url"]])
+                raise ValueError("La campaña ya no existe.")
+
+            changes["updated_at"] = datetime.utcnow()
+            try:
+                await save_with_unique_codes(
+                    lambda: Campaign.find_one(Campaign.id == campaign.id).update({"$set": changes}),
+                    parsed.recipients
+                )
+            except Exception:
+                # La campaña no llega a referenciar el nuevo archivo
+                await asset_service.release_assets([changes["recipients_file_url"]])
+                raise
+            await asset_service.release_assets([campaign.recipients_file_url])
+
+            await _set_job(job, {
+                "status": "COMPLETED",
+                "imported": len(parsed.recipients),
+                "skipped": parsed.skipped,
+                "issues": parsed.issues,
+                "finished_at": datetime.utcnow(),
+            })
+        except Exception as e:
+            error = e.detail if isinstance(e, HTTPException) else str(e)
+            log_event("import_failed", job_id=str(job.id), campaign_id=str(job.campaign_id), error=error)
+            await _set_job(job, {"status": "FAILED", "error": error, "finished_at": datetime.utcnow()})
+        finally:
+            IMPORT_JOB_SECONDS.labels(job.status).observe(time.perf_counter() - started)
+
+
+async def get_import_campaign(campaign_id: PydanticObjectId, current_user: User) -> CampaignImportState:
+    """
+    Verifica que la campaña sea del usuario y devuelve lo que necesita la
+    importación, con una proyección: no se carga el array de destinatarios.
+    """
+    campaign = await Campaign.find_one(
+        Campaign.id == campaign_id, Campaign.user_id == current_user.id
+    ).project(CampaignImportState)
+    if not campaign:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Campaña no encontrada."
+        )
+    return campaign
+
+
+async def start_import_job(
+    campaign: CampaignImportState,
+    file: UploadFile,
+    current_user: User,
+    background_tasks: BackgroundTasks
+) -> ImportJob:
+    """
+    Lee la subida (con sus límites) y crea el trabajo de importación; el
+    Excel se procesa después de responder. Si el archivo es idéntico al
+    actual, el trabajo se da por completado sin tocar los destinatarios.
+    """
+    upload = await upload_service.read_upload(file, "recipients")
+    try:
+        max_recipients = await get_max_recipients(current_user)
+        job = ImportJob(
+            campaign_id=campaign.id,
+            user_id=current_user.id,
+            filename=upload.filename,
+            recipients_file_sha256=upload.sha256,
+        )
+        if upload.sha256 == campaign.recipients_file_sha256:
+            job.status = "COMPLETED"
+            job.imported = campaign.stats.total
+            job.finished_at = datetime.utcnow()
+        await job.create()
+    except BaseException:
+        upload.close()
+        raise
+
+    if job.status == "COMPLETED":
+        upload.close()
+    else:
+        background_tasks.add_task(run_import_job, job, upload, max_recipients)
+    return job
+
+
+async def get_import_job(campaign_id: PydanticObjectId, job_id: PydanticObjectId, current_user: User) -> ImportJob:
+    """
+    Devuelve un trabajo de importación de la campaña. El trabajo guarda su
+    usuario, así que la consulta de progreso no necesita leer la campaña.
+    """
+    job = await ImportJob.find_one(
+        ImportJob.id == job_id, ImportJob.campaign_id == campaign_id, ImportJob.user_id == current_user.id
+    )
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Importación no encontrada."
+        )
+    return job
@@ -0,0 +1,280 @@
+# app/services/pdf_service.py
+
+from PIL import Image, ImageFont
+from typing import Callable
+import io
+import struct
+import zlib
+
+from app.core.cache import LRUCache
+from app.core.metrics import RENDER_DECODE_SECONDS, RENDER_DRAW_SECONDS, RENDER_ENCODE_SECONDS
+from app.core.tracing import span
+from app.services.render_service import RenderPlan, TextLine
+
+# Cuántas plantillas y fuentes pre-codificadas se mantienen en memoria por proceso
+TEMPLATE_CACHE_SIZE = 16
+FONT_CACHE_SIZE = 16
+
+# Unidades de la fuente en los diccionarios PDF (glifos de 1000 unidades por em)
+_FONT_UNITS = 1000
+_FIRST_CHAR = 32
+_LAST_CHAR = 255
+
+# Caracteres que el PDF puede usar (WinAnsi): los glifos que se incrustan
+_WINANSI_UNICODES = sorted({
+    ord(bytes([code]).decode("cp1252", errors="ignore") or " ") for code in range(_FIRST_CHAR, _LAST_CHAR + 1)
+})
+
+
+class _TemplateStream:
+    """Plantilla ya codificada como objeto imagen PDF, lista para copiarse tal cual."""
+    def __init__(self, width: int, height: int, dictionary: bytes, data: bytes):
+        self.width = width
+        self.height = height
+        self.dictionary = dictionary
+        self.data = data
+
+
+class _FontStreams:
+    """
+    Fuente ya preparada (y reducida) para incrustarse en un PDF. 'cff' indica
+    contornos CFF (.otf), que se incrustan como OpenType en /FontFile3.
+    """
+    def __init__(self, ascent: int, descent: int, bbox: tuple, widths: list[int], data: bytes, length: int, cff: bool = False):
+        self.ascent = ascent
+        self.descent = descent
+        self.bbox = bbox
+        self.widths = widths
+        self.data = data  # Programa de la fuente comprimido con Flate
+        self.length = length  # Tamaño sin comprimir (/Length1)
+        self.cff = cff
+
+
+_template_cache = LRUCache(TEMPLATE_CACHE_SIZE, name="pdf_templates")
+_font_cache = LRUCache(FONT_CACHE_SIZE, name="pdf_fonts")
+
+
+def _encode_template(template_bytes: bytes) -> _TemplateStream:
+    """
+    Codifica la plantilla como XObject de imagen.
+    Un JPEG se incrusta sin recodificar (DCTDecode); cualquier otra imagen se
+    aplana sobre blanco y se codifica una única vez como PNG, cuyos datos IDAT
+    (Flate con predictores PNG) son directamente válidos en un PDF.
+    """
+    image = Image.open(io.BytesIO(template_bytes))
+    width, height = image.size
+
+    if image.format == "JPEG" and image.mode in ("RGB", "L"):
+        color_space = b"/DeviceRGB" if image.mode == "RGB" else b"/DeviceGray"
+        dictionary = (
+            b"/Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s "
+            b"/BitsPerComponent 8 /Filter /DCTDecode" % (width, height, color_space)
+        )
+        return _TemplateStream(width, height, dictionary, template_bytes)
+
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, "white")
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        image = background
+    else:
+        image = image.convert("RGB")
+
+    # optimize: la plantilla se codifica una vez por proceso y se copia en
+    # cada PDF, así que compensa la compresión máxima
+    png_buffer = io.BytesIO()
+    image.save(png_buffer, format="PNG", optimize=True)
+    data = _png_idat(png_buffer.getvalue())
+    dictionary = (
+        b"/Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB "
+        b"/BitsPerComponent 8 /Filter /FlateDecode "
+        b"/DecodeParms << /Predictor 15 /Colors 3 /BitsPerComponent 8 /Columns %d >>"
+        % (width, height, width)
+    )
+    return _TemplateStream(width, height, dictionary, data)
+
+
+def _png_idat(png_bytes: bytes) -> bytes:
+    """Concatena los chunks IDAT de un PNG (el stream zlib de los píxeles)."""
+    position = 8  # Firma PNG
+    chunks = []
+    while position < len(png_bytes):
+        length, chunk_type = struct.unpack(">I4s", png_bytes[position:position + 8])
+        if chunk_type == b"IDAT":
+            chunks.append(png_bytes[position + 8:position + 8 + length])
+        position += 12 + length
+    return b"".join(chunks)
+
+
+def _subset_font(font_bytes: bytes) -> tuple[bytes, bool]:
+    """
+    Reduce la fuente a los glifos de WinAnsi (cp1252), los únicos que puede
+    usar el PDF: una fuente con miles de glifos pasa a ocupar unos KB. Devuelve
+    la fuente reducida y si sus contornos son CFF en vez de TrueType.
+    """
+    from fontTools import subset
+    from fontTools.ttLib import TTFont
+
+    font = TTFont(io.BytesIO(font_bytes), fontNumber=0)
+    if "CFF2" in font:
+        # Los visores de PDF no admiten CFF2 (fuentes variables .otf)
+        raise ValueError("La fuente usa contornos CFF2, que no se pueden incrustar en un PDF.")
+    cff = "CFF " in font
+
+    options = subset.Options()
+    # Sin tablas de maquetación: el PDF posiciona cada carácter
+    options.layout_features = []
+    options.drop_tables += ["GSUB", "GPOS", "GDEF", "BASE", "JSTF", "kern"]
+    # Sin hinting: solo ajusta los contornos a la rejilla de píxeles a tamaños
+    # pequeños en pantalla, y en una fuente TrueType ocupa un tercio del archivo
+    options.hinting = False
+    options.notdef_outline = True
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=_WINANSI_UNICODES)
+    subsetter.subset(font)
+
+    buffer = io.BytesIO()
+    font.save(buffer)
+    return buffer.getvalue(), cff
+
+
+def _encode_font(font_bytes: bytes) -> _FontStreams:
+    """Extrae las métricas necesarias para incrustar la fuente como fuente simple."""
+    font = ImageFont.truetype(io.BytesIO(font_bytes), _FONT_UNITS)
+    ascent, descent = font.getmetrics()
+    widths = []
+    for code in range(_FIRST_CHAR, _LAST_CHAR + 1):
+        try:
+            char = bytes([code]).decode("cp1252")
+        except UnicodeDecodeError:
+            widths.append(0)
+            continue
+        widths.append(round(font.getlength(char)))
+    bbox = font.getbbox("ÁÉÍÓÚÑgjpqy")
+    data, cff = _subset_font(font_bytes)
+    return _FontStreams(ascent, descent, bbox, widths, zlib.compress(data, 9), len(data), cff)
+
+
+def get_template_stream(template_url: str, fetch: Callable[[str], bytes]) -> _TemplateStream:
+    """Devuelve la plantilla pre-codificada, descargándola solo si no está en caché."""
+    stream = _template_cache.get(template_url)
+    if stream is None:
+        template_bytes = fetch(template_url)
+        with span("decode", RENDER_DECODE_SECONDS):
+            stream = _encode_template(template_bytes)
+        _template_cache.put(template_url, stream)
+    return stream
+
+
+def get_font_streams(font_url: str, fetch: Callable[[str], bytes]) -> _FontStreams:
+    """Devuelve la fuente preparada para el PDF, descargándola solo si no está en caché."""
+    streams = _font_cache.get(font_url)
+    if streams is None:
+        font_bytes = fetch(font_url)
+        with span("decode", RENDER_DECODE_SECONDS):
+            streams = _encode_font(font_bytes)
+        _font_cache.put(font_url, streams)
+    return streams
+
+
+def _pdf_string(text: str) -> bytes:
+    """Codifica un texto como literal PDF en WinAnsi (cp1252)."""
+    encoded = text.encode("cp1252", errors="replace")
+    return b"(" + encoded.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def _text_operation(page_height: int, line: TextLine) -> bytes:
+    """
+    Operadores PDF para dibujar una línea ya maquetada por el plan de render.
+    El plan usa coordenadas de Pillow (origen arriba); en PDF el origen está abajo.
+    """
+    red, green, blue = line.fill[:3]
+    return (
+        b"BT /F1 %d Tf %.4f %.4f %.4f rg 1 0 0 1 %.2f %.2f Tm %s Tj ET\n"
+        % (line.font_size, red / 255, green / 255, blue / 255, line.x, page_height - line.baseline, _pdf_string(line.text))
+    )
+
+
+def _font_objects(font: _FontStreams) -> list[bytes]:
+    """
+    Objetos 6 (Font), 7 (FontDescriptor) y 8 (programa de la fuente). Una
+    TrueType va en /FontFile2; una OpenType con contornos CFF, como Type1 con
+    /FontFile3 /Subtype /OpenType (PDF 1.6): en /FontFile2 el PDF queda roto.
+    """
+    widths = b" ".join(b"%d" % w for w in font.widths)
+    left, top, right, bottom = font.bbox
+    if font.cff:
+        subtype, font_file = b"/Type1", b"/FontFile3"
+        stream_dictionary = b"<< /Subtype /OpenType /Filter /FlateDecode /Length %d >>" % len(font.data)
+    else:
+        subtype, font_file = b"/TrueType", b"/FontFile2"
+        stream_dictionary = b"<< /Filter /FlateDecode /Length %d /Length1 %d >>" % (len(font.data), font.length)
+    return [
+        b"<< /Type /Font /Subtype %s /BaseFont /CertFont /FirstChar %d /LastChar %d "
+        b"/Widths [%s] /Encoding /WinAnsiEncoding /FontDescriptor 7 0 R >>"
+        % (subtype, _FIRST_CHAR, _LAST_CHAR, widths),
+        b"<< /Type /FontDescriptor /FontName /CertFont /Flags 32 /FontBBox [%d %d %d %d] "
+        b"/ItalicAngle 0 /Ascent %d /Descent -%d /CapHeight %d /StemV 80 %s 8 0 R >>"
+        % (left, font.ascent - bottom, right, font.ascent - top, font.ascent, font.descent, font.ascent, font_file),
+        stream_dictionary + b"\nstream\n" + font.data + b"\nendstream",
+    ]
+
+
+def render_certificate_pdf(
+    template_url: str,
+    font_url: str,
+    fetch: Callable[[str], bytes],
+    plan: RenderPlan,
+    values: dict[str, str]
+) -> bytes:
+    """
+    Genera el certificado como PDF de una página del tamaño de la plantilla
+    (1 px = 1 pt). La plantilla y la fuente se incrustan desde la caché ya
+    codificadas; por certificado solo se escribe la capa de texto.
+    """
+    template = get_template_stream(template_url, fetch)
+    font = get_font_streams(font_url, fetch)
+
+    with span("draw", RENDER_DRAW_SECONDS):
+        content = b"q %d 0 0 %d 0 0 cm /Im0 Do Q\n" % (template.width, template.height)
+        for line in plan.layout(values):
+            content += _text_operation(template.height, line)
+
+    with span("encode", RENDER_ENCODE_SECONDS):
+        return _assemble_pdf(template, font, content)
+
+
+def _assemble_pdf(template: _TemplateStream, font: _FontStreams, content: bytes) -> bytes:
+    """Escribe el PDF: objetos, tabla xref y trailer."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents 4 0 R "
+        b"/Resources << /XObject << /Im0 5 0 R >> /Font << /F1 6 0 R >> >> >>"
+        % (template.width, template.height),
+        b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream",
+        b"<< %s /Length %d >>\nstream\n" % (template.dictionary, len(template.data)),
+        *_font_objects(font),
+    ]
+
+    # 1.6: necesario para incrustar fuentes OpenType (/FontFile3 /Subtype /OpenType)
+    parts = [b"%PDF-1.6\n%\xe2\xe3\xcf\xd3\n"]
+    offset = len(parts[0])
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(offset)
+        if number == 5:
+            # El stream de la plantilla se añade sin copiarlo en un objeto intermedio
+            chunk = [b"%d 0 obj\n" % number, body, template.data, b"\nendstream\nendobj\n"]
+        else:
+            chunk = [b"%d 0 obj\n" % number, body, b"\nendobj\n"]
+        parts.extend(chunk)
+        offset += sum(len(c) for c in chunk)
+
+    xref = [b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)]
+    xref.extend(b"%010d 00000 n \n" % o for o in offsets)
+    parts.extend(xref)
+    parts.append(
+        b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, offset)
+    )
+    return b"".join(parts)
@@ -0,0 +1,171 @@
+# app/services/preview_service.py
+
+from fastapi import WebSocket, WebSocketDisconnect
+from PIL import Image
+from beanie import PydanticObjectId
+from datetime import datetime
+import asyncio
+import io
+import json
+
+from app.models.campaign_model import Campaign
+from app.models.typography_model import Typography
+from app.services.campaign_service import _set_fields, scale_config
+from app.services.certificate_service import download_file
+from app.services.render_service import compile_render_plan, sample_values
+
+# Lado mayor de la imagen de previsualización (px)
+PREVIEW_MAX_SIDE = 1000
+PREVIEW_JPEG_QUALITY = 75
+
+# Parámetros de la configuración que el editor puede modificar en vivo
+EDITABLE_FIELDS = {
+    "name_pos_x", "name_pos_y", "name_font_size", "name_color",
+    "code_pos_x", "code_pos_y", "code_font_size", "code_color",
+    "typography_id", "text_fields",
+}
+
+
+class PreviewSession:
+    """
+    Estado de una sesión de previsualización: la plantilla reducida y la fuente
+    se cargan una única vez; cada frame solo dibuja el texto y codifica un JPEG.
+    """
+    def __init__(self, template_image: Image.Image, scale: float, font_data: bytes, config: Campaign.ConfigSettings):
+        self.template_image = template_image
+        self.scale = scale
+        self.font_data = font_data
+        self.config = config
+        self.sample_name = "Nombre Apellido"
+        self.sample_code = "ABCD2345EFGH"
+
+    def render(self) -> bytes:
+        """Dibuja el frame actual a resolución reducida. Llamar desde un hilo."""
+        config = scale_config(self.config, self.scale)
+        values = sample_values(config)
+        values.update({"name": self.sample_name, "unique_code": self.sample_code})
+        image = compile_render_plan(config, self.font_data).draw(self.template_image, values)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=PREVIEW_JPEG_QUALITY)
+        return buffer.getvalue()
+
+
+def _load_preview_template(campaign: Campaign) -> tuple[Image.Image, float]:
+    """
+    Carga la plantilla a resolución de previsualización.
+    Usa el derivado 'preview' si existe; si no, reduce el master.
+    Devuelve la imagen y la escala respecto al master.
+    """
+    preview_url = campaign.template_derivatives.get("preview")
+    image = Image.open(io.BytesIO(download_file(preview_url or campaign.template_image_url)))
+    image.load()
+
+    master_width = campaign.template_width or image.width
+    if not preview_url and max(image.size) > PREVIEW_MAX_SIDE:
+        image.thumbnail((PREVIEW_MAX_SIDE, PREVIEW_MAX_SIDE), Image.Resampling.LANCZOS)
+    return image, image.width / master_width
+
+
+async def _load_font(typography_id: PydanticObjectId) -> bytes:
+    typography = await Typography.get(typography_id)
+    if not typography:
+        raise ValueError("La tipografía indicada no existe.")
+    return await asyncio.to_thread(download_file, typography.font_file_url)
+
+
+def _apply_changes(session: PreviewSession, changes: dict):
+    """Aplica los parámetros recibidos a la sesión, validándolos con el modelo."""
+    if "sample_name" in changes:
+        session.sample_name = str(changes["sample_name"])
+    if "sample_code" in changes:
+        session.sample_code = str(changes["sample_code"])
+    updates = {k: v for k, v in changes.items() if k in EDITABLE_FIELDS}
+    if updates:
+        session.config = Campaign.ConfigSettings(**{**session.config.model_dump(), **updates})
+
+
+async def run_preview_session(websocket: WebSocket, campaign: Campaign):
+    """
+    Sesión de previsualización en vivo para el editor de plantillas.
+
+    El cliente envía mensajes JSON con los parámetros que cambian
+    (p. ej. {"name_pos_x": 420}) y recibe cada frame como JPEG binario.
+    Los mensajes que llegan mientras se renderiza se fusionan, de modo que
+    solo se dibuja el estado más reciente. Con {"action": "save"} se guarda
+    la configuración actual en la campaña, sin volver a subir la plantilla.
+    """
+    try:
+        template_image, scale = await asyncio.to_thread(_load_preview_template, campaign)
+        font_data = await _load_font(campaign.config.typography_id)
+    except Exception as e:
+        await websocket.send_json({"error": f"No se pudo cargar la plantilla o la fuente: {e}"})
+        await websocket.close()
+        return
+
+    session = PreviewSession(template_image, scale, font_data, campaign.config)
+    pending: dict = {}
+    dirty = asyncio.Event()
+    dirty.set()  # Primer frame con la configuración guardada
+
+    async def receive_changes():
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError as e:
+                await websocket.send_json({"error": f"Mensaje no válido (se espera JSON): {e}"})
+                continue
+            if not isinstance(message, dict):
+                continue
+            if message.pop("action", None) == "save":
+                # Se serializa con el render para guardar el estado ya aplicado
+                pending["__save__"] = True
+            pending.update(message)
+            dirty.set()
+
+    async def render_frames():
+        while True:
+            await dirty.wait()
+            dirty.clear()
+            changes = dict(pending)
+            pending.clear()
+            save_requested = changes.pop("__save__", False)
+
+            # Se dibuja antes de guardar: unos parámetros que no se pueden dibujar
+            # (p. ej. un color no válido) se rechazan y la sesión sigue con el
+            # último estado válido, sin escribirlo en la campaña
+            previous = (session.config, session.font_data, session.sample_name, session.sample_code)
+            frame = None
+            try:
+                if "typography_id" in changes and str(changes["typography_id"]) != str(session.config.typography_id):
+                    session.font_data = await _load_font(PydanticObjectId(changes["typography_id"]))
+                _apply_changes(session, changes)
+                if changes or not save_requested:
+                    frame = await asyncio.to_thread(session.render)
+            except Exception as e:
+                session.config, session.font_data, session.sample_name, session.sample_code = previous
+                await websocket.send_json({"error": f"Parámetros no válidos: {e}"})
+                continue
+
+            if save_requested:
+                # Solo se escribe lo que controla la sesión: la campaña cargada al
+                # abrirla puede estar desactualizada (destinatarios, contadores,
+                # plantilla cambiados después por PATCH o importaciones)
+                await _set_fields(campaign, {"config": session.config, "updated_at": datetime.utcnow()})
+                await websocket.send_json({"saved": True})
+
+            if frame is not None:
+                await websocket.send_bytes(frame)
+
+    receiver = asyncio.create_task(receive_changes())
+    renderer = asyncio.create_task(render_frames())
+    try:
+        done, _ = await asyncio.wait({receiver, renderer}, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            exception = task.exception()
+            if exception and not isinstance(exception, WebSocketDisconnect):
+                raise exception
+    finally:
+        receiver.cancel()
+        renderer.cancel()
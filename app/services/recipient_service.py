@@ -0,0 +1,394 @@
+# app/services/recipient_service.py
+
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from beanie import PydanticObjectId
+from datetime import datetime
+from typing import AsyncIterator, Optional
+import asyncio
+import base64
+import csv
+import io
+import json
+import re
+import tempfile
+
+from app.core.read_preference import secondary_reads
+from app.core.tracing import log_event
+from app.models.campaign_model import Campaign
+from app.models.user_model import User
+from app.schemas.campaign_schema import CampaignStats, RecipientDisplay, RecipientPage
+
+# Tope del $slice (el operador exige un número de elementos positivo)
+_SLICE_ALL = 2**31 - 1
+
+# Destinatarios que examina como máximo una página del listado. Con filtros
+# poco selectivos la página puede salir incompleta (o vacía) con cursor:
+# el cliente sigue pidiendo páginas hasta que next_cursor es None
+RECIPIENTS_SCAN_WINDOW = 2000
+
+# Filas por bloque en la exportación (cada bloque se envía o escribe de una vez)
+EXPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# Caracteres iniciales con los que una hoja de cálculo interpreta una fórmula
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+EXPORT_COLUMNS = ["nombre", "correo", "codigo", "estado_email", "certificado_url", "reclamado_el"]
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def encode_cursor(index: int) -> str:
+    """Cursor opaco: posición del siguiente destinatario en el array."""
+    return base64.urlsafe_b64encode(json.dumps({"i": index}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    if not cursor:
+        return 0
+    try:
+        index = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))["i"]
+        if not isinstance(index, int) or index < 0:
+            raise ValueError
+        return index
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El cursor de paginación no es válido."
+        )
+
+
+async def _ensure_owner(campaign_id: PydanticObjectId, current_user: User):
+    """
+    Verifica que la campaña exista y sea del usuario sin cargar el documento
+    (y, con él, todo el array de destinatarios).
+    """
+    count = await Campaign.find(Campaign.id == campaign_id, Campaign.user_id == current_user.id).count()
+    if not count:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Campaña no encontrada."
+        )
+
+
+def _recipient_filters(
+    email_status: Optional[str],
+    claimed: Optional[bool],
+    search: Optional[str]
+) -> dict:
+    """Condiciones sobre 'recipient' (un destinatario ya desenrollado)."""
+    filters = {}
+    if email_status:
+        filters["recipient.email_status"] = email_status.upper()
+    if claimed is True:
+        filters["recipient.claimed_at"] = {"$ne": None}
+    elif claimed is False:
+        filters["recipient.claimed_at"] = None
+    if search:
+        prefix = {"$regex": f"^{re.escape(search.strip())}", "$options": "i"}
+        filters["$or"] = [{"recipient.name": prefix}, {"recipient.email": prefix}]
+    return filters
+
+
+def recipients_pipeline(
+    campaign_id: PydanticObjectId,
+    user_id: PydanticObjectId,
+    start: int = 0,
+    filters: Optional[dict] = None,
+    window: int = _SLICE_ALL
+) -> list[dict]:
+    """
+    Agregación que devuelve los destinatarios de la campaña uno por documento
+    ({"index": posición en el array, "recipient": {...}}), empezando en 'start'
+    y examinando como máximo 'window' destinatarios (por defecto, hasta el
+    final: la exportación los recorre todos).
+    """
+    pipeline = [
+        {"$match": {"_id": campaign_id, "user_id": user_id}},
+        {"$project": {"_id": 0, "recipient": {"$slice": ["$recipients", start, window]}}},
+        {"$unwind": {"path": "$recipient", "includeArrayIndex": "offset"}},
+    ]
+    if filters:
+        pipeline.append({"$match": filters})
+    pipeline.append({"$project": {"index": {"$add": ["$offset", start]}, "recipient": 1}})
+    return pipeline
+
+
+def recipients_page_pipeline(
+    campaign_id: PydanticObjectId,
+    user_id: PydanticObjectId,
+    start: int,
+    limit: int,
+    filters: Optional[dict] = None
+) -> list[dict]:
+    """
+    Una página del listado: como mucho 'limit' + 1 destinatarios (el de más
+    indica que hay página siguiente) de una ventana de RECIPIENTS_SCAN_WINDOW
+    a partir de 'start', y el tamaño del array para saber si la ventana llegó
+    al final. Se desenrolla y filtra solo la ventana, así que el trabajo por
+    página está acotado aunque la campaña sea muy grande o el filtro muy
+    selectivo (MongoDB sigue leyendo el documento completo, eso no se evita
+    con los destinatarios embebidos).
+    """
+    stages = recipients_pipeline(campaign_id, user_id, start, filters, RECIPIENTS_SCAN_WINDOW)
+    match, window = stages[0], stages[1]
+    window["$project"]["size"] = {"$size": "$recipients"}
+    page = stages[2:]
+    page.insert(-1, {"$limit": limit + 1})
+    return [
+        match,
+        window,
+        {"$facet": {"rows": page, "size": [{"$project": {"size": 1}}]}},
+    ]
+
+
+@secondary_reads
+async def list_recipients(
+    campaign_id: PydanticObjectId,
+    current_user: User,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    email_status: Optional[str] = None,
+    claimed: Optional[bool] = None,
+    search: Optional[str] = None
+) -> RecipientPage:
+    """
+    Servicio para listar los destinatarios de una campaña por páginas, con
+    filtros por estado del email, certificado reclamado o no, y prefijo del
+    nombre o del correo. Cada página examina como máximo
+    RECIPIENTS_SCAN_WINDOW destinatarios: si la ventana se agota antes de
+    reunir 'limit' resultados, la página sale incompleta y el cursor apunta
+    al final de la ventana, para seguir desde ahí.
+    """
+    await _ensure_owner(campaign_id, current_user)
+    start = decode_cursor(cursor)
+
+    pipeline = recipients_page_pipeline(
+        campaign_id, current_user.id, start, limit, _recipient_filters(email_status, claimed, search)
+    )
+    result = await Campaign.aggregate(pipeline).to_list()
+    rows = result[0]["rows"] if result else []
+    size = result[0]["size"][0]["size"] if result and result[0]["size"] else 0
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["index"] + 1)
+    elif start + RECIPIENTS_SCAN_WINDOW < size:
+        next_cursor = encode_cursor(start + RECIPIENTS_SCAN_WINDOW)
+
+    return RecipientPage(
+        items=[RecipientDisplay(**row["recipient"]) for row in rows],
+        next_cursor=next_cursor
+    )
+
+
+def _safe_cell(value: Optional[str]) -> Optional[str]:
+    """
+    Evita la inyección de fórmulas: Excel y LibreOffice ejecutan como fórmula
+    una celda que empieza por =, +, -, @, tabulador o retorno de carro. El
+    nombre y el correo vienen del Excel del usuario, así que se anteponen con '.
+    """
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _export_row(recipient: dict) -> list:
+    claimed_at = recipient.get("claimed_at")
+    row = [
+        recipient.get("name"),
+        recipient.get("email"),
+        recipient.get("unique_code"),
+        recipient.get("email_status"),
+        recipient.get("certificate_url") or "",
+        claimed_at.strftime("%Y-%m-%d %H:%M:%S") if claimed_at else "",
+    ]
+    return [_safe_cell(value) for value in row]
+
+
+async def _export_batches(campaign_id: PydanticObjectId, user_id: PydanticObjectId) -> AsyncIterator[list[list]]:
+    """Recorre los destinatarios con un cursor de la base de datos, por bloques."""
+    pipeline = recipients_pipeline(campaign_id, user_id)
+    # Solo los campos exportados
+    pipeline.append({"$project": {f"recipient.{key}": 1 for key in (
+        "name", "email", "unique_code", "email_status", "certificate_url", "claimed_at"
+    )}})
+    batch = []
+    async for row in Campaign.aggregate(pipeline):
+        batch.append(_export_row(row["recipient"]))
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _stream_csv(campaign_id: PydanticObjectId, user_id: PydanticObjectId) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM para que Excel detecte UTF-8 (tildes, eñes)
+    buffer.write("\ufeff")
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue().encode("utf-8")
+
+    async for batch in _export_batches(campaign_id, user_id):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue().encode("utf-8")
+
+
+async def _stream_xlsx(campaign_id: PydanticObjectId, user_id: PydanticObjectId) -> AsyncIterator[bytes]:
+    """
+    El libro se escribe en modo write-only: openpyxl vuelca cada fila a un
+    temporal en disco en vez de mantener las celdas en memoria. El XLSX es un
+    ZIP que solo se puede cerrar al final, así que se envía al terminar.
+    """
+    # openpyxl se importa en la primera exportación a XLSX, no al arrancar
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Destinatarios")
+    sheet.append(EXPORT_COLUMNS)
+
+    def append_rows(rows: list[list]):
+        for row in rows:
+            sheet.append(row)
+
+    async for batch in _export_batches(campaign_id, user_id):
+        await asyncio.to_thread(append_rows, batch)
+
+    with tempfile.TemporaryFile() as output:
+        await asyncio.to_thread(workbook.save, output)
+        output.seek(0)
+        while chunk := await asyncio.to_thread(output.read, EXPORT_CHUNK_SIZE):
+            yield chunk
+
+
+async def export_recipients(
+    campaign_id: PydanticObjectId,
+    current_user: User,
+    export_format: str = "csv"
+) -> StreamingResponse:
+    """
+    Servicio para exportar los destinatarios con su código, estado del email,
+    URL del certificado y fecha de reclamación. Las filas se leen de la base
+    de datos con un cursor y se envían a medida que llegan; la campaña nunca
+    se carga entera en memoria.
+    """
+    export_format = export_format.lower()
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Formato no soportado: {export_format}. Usa csv o xlsx."
+        )
+    await _ensure_owner(campaign_id, current_user)
+
+    stream = _stream_csv if export_format == "csv" else _stream_xlsx
+    return StreamingResponse(
+        stream(campaign_id, current_user.id),
+        media_type=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="destinatarios_{campaign_id}.{export_format}"'}
+    )
+
+
+def _count_where(condition: dict) -> dict:
+    """Expresión que cuenta los destinatarios que cumplen la condición."""
+    return {"$size": {"$filter": {"input": "$recipients", "as": "r", "cond": condition}}}
+
+
+def _stats_expressions() -> dict:
+    """Expresiones de agregación de cada contador, calculado desde los destinatarios."""
+    return {
+        "total": {"$size": "$recipients"},
+        "pending": _count_where({"$eq": ["$$r.email_status", "PENDING"]}),
+        "sent": _count_where({"$eq": ["$$r.email_status", "SENT"]}),
+        "failed": _count_where({"$eq": ["$$r.email_status", "FAILED"]}),
+        "claimed": _count_where({"$gt": ["$$r.claimed_at", None]}),
+    }
+
+
+async def backfill_stats() -> int:
+    """
+    Migración (python -m app.core.migrations backfill_stats): inicializa los
+    contadores de las campañas con destinatarios creadas antes de que
+    existieran (sin 'stats' o con total 0); si no, el primer $inc de
+    set_email_status los dejaría en negativo. Cada campaña se calcula en el
+    servidor en una única actualización atómica, así que no pisa envíos
+    concurrentes. Devuelve las campañas corregidas.
+    """
+    result = await Campaign.get_pymongo_collection().update_many(
+        {
+            "recipients.0": {"$exists": True},
+            "$or": [{"stats": {"$exists": False}}, {"stats.total": {"$in": [0, None]}}],
+        },
+        [{"$set": {"stats": _stats_expressions()}}],
+    )
+    log_event("stats_backfilled", matched=result.matched_count, modified=result.modified_count)
+    return result.modified_count
+
+
+@secondary_reads
+async def get_campaign_stats(campaign_id: PydanticObjectId, current_user: User) -> Campaign.StatsCounters:
+    """
+    Servicio para obtener los contadores de una campaña. Se leen los
+    contadores guardados (una proyección de unos pocos enteros, sin el array
+    de destinatarios) de un secundario; pueden ir unos segundos por detrás.
+    Se mantienen con $inc al enviar y reclamar.
+    """
+    campaign = await Campaign.find_one(
+        Campaign.id == campaign_id, Campaign.user_id == current_user.id
+    ).project(CampaignStats)
+    if not campaign:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Campaña no encontrada."
+        )
+    return campaign.stats
+
+
+def initial_stats(recipients_count: int) -> Campaign.StatsCounters:
+    """Contadores de una lista de destinatarios recién importada."""
+    return Campaign.StatsCounters(total=recipients_count, pending=recipients_count)
+
+
+async def set_email_status(campaign_id: PydanticObjectId, unique_code: str, previous: str, new: str) -> bool:
+    """
+    Cambia el estado del email de un destinatario y ajusta los contadores en
+    la misma operación atómica. Solo se aplica si el destinatario seguía en
+    el estado 'previous', así que los contadores no se descuadran.
+    """
+    if previous == new:
+        return False
+    result = await Campaign.find_one({
+        "_id": campaign_id,
+        "recipients": {"$elemMatch": {"unique_code": unique_code, "email_status": previous}},
+    }).update({
+        "$set": {"recipients.$.email_status": new},
+        "$inc": {f"stats.{previous.lower()}": -1, f"stats.{new.lower()}": 1},
+    })
+    return bool(result and result.modified_count)
+
+
+async def mark_claimed(campaign_id: PydanticObjectId, unique_code: str, certificate_url: Optional[str]):
+    """
+    Registra la reclamación de un certificado. La primera reclamación guarda
+    la fecha y suma uno a 'claimed'; las siguientes solo actualizan la URL.
+    """
+    now = datetime.utcnow()
+    result = await Campaign.find_one({
+        "_id": campaign_id,
+        "recipients": {"$elemMatch": {"unique_code": unique_code, "claimed_at": None}},
+    }).update({
+        "$set": {"recipients.$.certificate_url": certificate_url, "recipients.$.claimed_at": now},
+        "$inc": {"stats.claimed": 1},
+    })
+    if not (result and result.modified_count):
+        await Campaign.find_one({"_id": campaign_id, "recipients.unique_code": unique_code}).update({
+            "$set": {"recipients.$.certificate_url": certificate_url}
+        })
@@ -0,0 +1,226 @@
+# app/services/render_service.py
+
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+from typing import Callable, Optional
+import io
+import threading
+
+from app.core.cache import LRUCache
+from app.core.metrics import RENDER_DECODE_SECONDS
+from app.core.tracing import span
+from app.models.campaign_model import Campaign, Recipient, TextField
+
+# Planes compilados que se mantienen en memoria por proceso. Cada plan guarda la
+# plantilla decodificada, así que el tamaño de la caché limita la memoria usada.
+RENDER_PLAN_CACHE_SIZE = 8
+
+_ALIGN_ANCHORS = {"left": "la", "center": "ma", "right": "ra"}
+
+_plan_cache = LRUCache(RENDER_PLAN_CACHE_SIZE, name="render_plans")
+
+
+class TextLine:
+    """Una línea ya maquetada: texto, esquina izquierda de la línea base y fuente."""
+    def __init__(self, text: str, x: float, baseline: float, font_size: int, fill: tuple, font: ImageFont.FreeTypeFont):
+        self.text = text
+        self.x = x
+        self.baseline = baseline
+        self.font_size = font_size
+        self.fill = fill
+        self.font = font
+
+
+class CompiledField:
+    """
+    Campo de texto preparado para dibujarse muchas veces: color ya parseado,
+    ancla validada y fuentes cargadas (las de tamaño reducido, bajo demanda).
+    """
+    def __init__(self, field: TextField, font_data: bytes):
+        self.source = field.source.strip().lower()
+        self.x = field.pos_x
+        self.y = field.pos_y
+        self.font_size = field.font_size
+        self.fill = ImageColor.getrgb(field.color)
+        self.align = field.align
+        # El ancla se resuelve una vez: explícita, o derivada de la alineación
+        self.horizontal, self.vertical = field.anchor or _ALIGN_ANCHORS[field.align]
+        self.max_width = field.max_width
+        self.auto_shrink = field.auto_shrink and field.max_width is not None
+        self.min_font_size = min(field.min_font_size, field.font_size)
+        self._font_data = font_data
+        self._fonts = {field.font_size: ImageFont.truetype(io.BytesIO(font_data), field.font_size)}
+        self._lock = threading.Lock()
+
+    def font(self, size: int) -> ImageFont.FreeTypeFont:
+        font = self._fonts.get(size)
+        if font is None:
+            with self._lock:
+                font = self._fonts.get(size)
+                if font is None:
+                    font = ImageFont.truetype(io.BytesIO(self._font_data), size)
+                    self._fonts[size] = font
+        return font
+
+    def _fit(self, text: str) -> int:
+        """Tamaño de fuente para que el texto quepa en max_width (si auto_shrink)."""
+        size = self.font_size
+        if not self.auto_shrink:
+            return size
+        length = self.font(size).getlength(text)
+        while length > self.max_width and size > self.min_font_size:
+            # Salto proporcional y luego ajuste fino de un punto
+            size = max(self.min_font_size, min(size - 1, int(size * self.max_width / length)))
+            length = self.font(size).getlength(text)
+        return size
+
+    def _wrap(self, text: str, font: ImageFont.FreeTypeFont) -> list[str]:
+        """Parte el texto por palabras para no superar max_width."""
+        if self.max_width is None or font.getlength(text) <= self.max_width:
+            return [text]
+        lines, current = [], ""
+        for word in text.split():
+            candidate = f"{current} {word}".strip()
+            if current and font.getlength(candidate) > self.max_width:
+                lines.append(current)
+                current = word
+            else:
+                current = candidate
+        if current:
+            lines.append(current)
+        return lines
+
+    def layout(self, text: str) -> list[TextLine]:
+        size = self._fit(text)
+        font = self.font(size)
+        ascent, descent = font.getmetrics()
+        lines = self._wrap(text, font)
+        widths = [font.getlength(line) for line in lines]
+        block_width = max(widths)
+        line_height = ascent + descent
+        block_height = line_height * len(lines)
+
+        left = self.x - {"l": 0, "m": block_width / 2, "r": block_width}[self.horizontal]
+        if self.vertical in "at":
+            top = self.y
+        elif self.vertical == "m":
+            top = self.y - block_height / 2
+        elif self.vertical == "s":
+            top = self.y - ascent
+        else:
+            top = self.y - block_height
+
+        result = []
+        for index, (line, width) in enumerate(zip(lines, widths)):
+            offset = {"left": 0, "center": (block_width - width) / 2, "right": block_width - width}[self.align]
+            result.append(TextLine(line, left + offset, top + ascent + index * line_height, size, self.fill, font))
+        return result
+
+
+class RenderPlan:
+    """
+    Configuración de una campaña compilada para renderizar: campos con fuentes
+    precargadas y anclas resueltas, más la plantilla decodificada (bajo demanda,
+    porque el modo PDF no la necesita).
+    """
+    def __init__(self, fields: list[CompiledField], template_url: Optional[str] = None):
+        self.fields = fields
+        self.template_url = template_url
+        self._template: Optional[Image.Image] = None
+        self._lock = threading.Lock()
+
+    def template_image(self, fetch: Callable[[str], bytes]) -> Image.Image:
+        if self._template is None:
+            with self._lock:
+                if self._template is None:
+                    data = fetch(self.template_url)
+                    with span("decode", RENDER_DECODE_SECONDS):
+                        image = Image.open(io.BytesIO(data))
+                        image.load()
+                    self._template = image
+        return self._template
+
+    def layout(self, values: dict[str, str]) -> list[TextLine]:
+        lines = []
+        for field in self.fields:
+            text = values.get(field.source)
+            if text:
+                lines.extend(field.layout(str(text)))
+        return lines
+
+    def draw(self, template_image: Image.Image, values: dict[str, str]) -> Image.Image:
+        """Dibuja los campos sobre una copia de la plantilla."""
+        image = template_image.copy()
+        draw = ImageDraw.Draw(image)
+        for line in self.layout(values):
+            draw.text((line.x, line.baseline), line.text, font=line.font, fill=line.fill, anchor="ls")
+        return image
+
+
+def effective_text_fields(config: Campaign.ConfigSettings) -> list[TextField]:
+    """
+    Campos de texto de la configuración. Las campañas sin 'text_fields' se
+    traducen desde name_* y code_*, con el mismo resultado que antes.
+    """
+    if config.text_fields:
+        return list(config.text_fields)
+
+    fields = [TextField(
+        source="name",
+        pos_x=config.name_pos_x,
+        pos_y=config.name_pos_y,
+        font_size=config.name_font_size,
+        color=config.name_color,
+        anchor="la",
+    )]
+    if config.code_pos_x is not None and config.code_pos_y is not None:
+        fields.append(TextField(
+            source="unique_code",
+            pos_x=config.code_pos_x,
+            pos_y=config.code_pos_y,
+            font_size=config.code_font_size or 30,
+            color=config.code_color or "#000000",
+            anchor="la",
+        ))
+    return fields
+
+
+def compile_render_plan(config: Campaign.ConfigSettings, font_data: bytes, template_url: Optional[str] = None) -> RenderPlan:
+    """Compila la configuración sin pasar por la caché (p. ej. para la previsualización)."""
+    fields = [CompiledField(field, font_data) for field in effective_text_fields(config)]
+    return RenderPlan(fields, template_url)
+
+
+def get_render_plan(campaign: Campaign, font_url: str, fetch: Callable[[str], bytes]) -> RenderPlan:
+    """
+    Devuelve el plan compilado de la campaña. Se reutiliza entre renders y solo
+    se recompila cuando cambian la configuración, la plantilla o la fuente.
+    """
+    key = (str(campaign.id), campaign.template_image_url, font_url, campaign.config.model_dump_json())
+    plan = _plan_cache.get(key)
+    if plan is None:
+        font_data = fetch(font_url)
+        with span("decode", RENDER_DECODE_SECONDS):
+            plan = compile_render_plan(campaign.config, font_data, campaign.template_image_url)
+        _plan_cache.put(key, plan)
+    return plan
+
+
+def recipient_values(recipient: Recipient) -> dict[str, str]:
+    """Valores de un destinatario disponibles como 'source' de los campos."""
+    values = {key.strip().lower(): value for key, value in recipient.fields.items()}
+    values.update({
+        "name": recipient.name,
+        "nombre": recipient.name,
+        "email": recipient.email,
+        "correo": recipient.email,
+        "unique_code": recipient.unique_code,
+        "code": recipient.unique_code,
+    })
+    return values
+
+
+def sample_values(config: Campaign.ConfigSettings) -> dict[str, str]:
+    """Valores de ejemplo para previsualizar o medir una configuración."""
+    values = {field.source.strip().lower(): field.source.strip().capitalize() for field in effective_text_fields(config)}
+    values.update({"name": "Nombre Apellido Ejemplo", "unique_code": "ABCD2345EFGH"})
+    return values
@@ -3,19 +3,21 @@
 from fastapi import HTTPException, status, UploadFile
 from beanie import PydanticObjectId
 from typing import List
-import cloudinary
-import cloudinary.uploader
 
 from app.models.typography_model import Typography
 from app.schemas.typography_schema import TypographyCreate, TypographyUpdate
+from app.core.read_preference import secondary_reads
+from app.services import asset_service, upload_service
 from datetime import datetime
-from app.core.config import settings
 
-cloudinary.config(
-    cloud_name=settings.CLOUDINARY_CLOUD_NAME,
-    api_key=settings.CLOUDINARY_API_KEY,
-    api_secret=settings.CLOUDINARY_API_SECRET,
-)
+
+async def _acquire_font(file: UploadFile) -> str:
+    """Almacena el archivo de fuente por contenido y devuelve su URL."""
+    with await upload_service.read_upload(file, "font") as upload:
+        asset = await asset_service.acquire_asset(
+            upload.open(), resource_type="raw", extension=upload.extension, sha256=upload.sha256, size=upload.size
+        )
+    return asset.url
 
 
 async def create_typography(typography_data: TypographyCreate, file: UploadFile) -> Typography:
@@ -30,23 +32,10 @@ async def create_typography(typography_data: TypographyCreate, file: UploadFile)
             detail=f"Ya existe una tipografía con el nombre '{typography_data.name}'."
         )
     
-    # 2. Subir el archivo de fuente a Cloudinary
-    # Estructura: certhub-api/typographies/nombre_archivo
-    upload_result = cloudinary.uploader.upload(
-        file.file,
-        folder="certhub-api/typographies",
-        resource_type="raw"  # Para archivos que no son imágenes
-    )
-    
-    # 3. Obtener la URL segura del archivo
-    font_url = upload_result.get("secure_url")
-    if not font_url:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="No se pudo subir el archivo de fuente a Cloudinary."
-        )
+    # 2. Almacenar el archivo de fuente (si ya existe el mismo archivo, se reutiliza)
+    font_url = await _acquire_font(file)
     
-    # 4. Crear la tipografía en la base de datos
+    # 3. Crear la tipografía en la base de datos
     typography = Typography(
         name=typography_data.name,
         font_file_url=font_url
@@ -56,6 +45,7 @@ async def create_typography(typography_data: TypographyCreate, file: UploadFile)
     return typography
 
 
+@secondary_reads
 async def get_all_typographies() -> List[Typography]:
     """
     Servicio para obtener todas las tipografías.
@@ -63,10 +53,8 @@ async def get_all_typographies() -> List[Typography]:
     return await Typography.find_all().to_list()
 
 
-async def get_typography_by_id(typography_id: PydanticObjectId) -> Typography:
-    """
-    Servicio para obtener una tipografía por su ID.
-    """
+async def _get_typography(typography_id: PydanticObjectId) -> Typography:
+    """Busca la tipografía (en el primario, antes de modificarla)."""
     typography = await Typography.get(typography_id)
     
     if not typography:
@@ -78,6 +66,14 @@ async def get_typography_by_id(typography_id: PydanticObjectId) -> Typography:
     return typography
 
 
+@secondary_reads
+async def get_typography_by_id(typography_id: PydanticObjectId) -> Typography:
+    """
+    Servicio para obtener una tipografía por su ID.
+    """
+    return await _get_typography(typography_id)
+
+
 async def update_typography(
     typography_id: PydanticObjectId,
     update_data: TypographyUpdate
@@ -85,7 +81,7 @@ async def update_typography(
     """
     Servicio para actualizar una tipografía.
     """
-    typography = await get_typography_by_id(typography_id)
+    typography = await _get_typography(typography_id)
     
     # Convertir el esquema a diccionario, excluyendo campos no establecidos
     update_dict = update_data.model_dump(exclude_unset=True)
@@ -118,25 +114,16 @@ async def update_typography_file(
     """
     Servicio para actualizar solo el archivo de fuente de una tipografía.
     """
-    typography = await get_typography_by_id(typography_id)
-    
-    # Subir el nuevo archivo a Cloudinary
-    upload_result = cloudinary.uploader.upload(
-        file.file,
-        folder="certhub-api/typographies",
-        resource_type="raw"
-    )
+    typography = await _get_typography(typography_id)
     
-    font_url = upload_result.get("secure_url")
-    if not font_url:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="No se pudo subir el archivo de fuente a Cloudinary."
-        )
+    # Almacenar el nuevo archivo
+    font_url = await _acquire_font(file)
+    previous_url = typography.font_file_url
     
-    # Actualizar la URL del archivo
+    # Actualizar la URL del archivo y liberar el anterior
     typography.font_file_url = font_url
     await typography.save()
+    await asset_service.release_assets([previous_url])
     
     return typography
 
@@ -145,9 +132,10 @@ async def delete_typography(typography_id: PydanticObjectId):
     """
     Servicio para eliminar una tipografía.
     """
-    typography = await get_typography_by_id(typography_id)
+    typography = await _get_typography(typography_id)
     
-    # Eliminar el documento
+    # Eliminar el documento y liberar el archivo de fuente
     await typography.delete()
+    await asset_service.release_assets([typography.font_file_url])
     
     return
@@ -0,0 +1,197 @@
+# app/services/upload_service.py
+
+from fastapi import File, HTTPException, Request, status, UploadFile
+from fastapi.routing import APIRoute
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Callable, Optional
+import asyncio
+import hashlib
+import os
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Margen del cuerpo multipart sobre los archivos (límites entre partes y
+# campos de texto como text_fields) al comprobar Content-Length
+UPLOAD_FORM_OVERHEAD = 1024 * 1024
+
+# Clave con la que upload_file() marca el tipo de archivo de un parámetro
+_UPLOAD_KIND = "upload_kind"
+
+# Cualquier cliente puede enviar este tipo genérico (p. ej. para fuentes o Excel)
+_GENERIC_CONTENT_TYPE = "application/octet-stream"
+
+
+@dataclass(frozen=True)
+class UploadLimits:
+    max_bytes: int
+    content_types: frozenset
+    extensions: frozenset
+    default_extension: str
+    allow_generic: bool = False  # Aceptar application/octet-stream si la extensión es válida
+
+
+# Límites por tipo de archivo subido
+UPLOAD_LIMITS = {
+    "template": UploadLimits(
+        max_bytes=25 * 1024 * 1024,
+        content_types=frozenset({"image/png", "image/jpeg", "image/webp", "image/gif", "image/bmp", "image/tiff"}),
+        extensions=frozenset({".png", ".jpg", ".jpeg", ".webp", ".gif", ".bmp", ".tif", ".tiff"}),
+        default_extension=".png",
+    ),
+    "recipients": UploadLimits(
+        max_bytes=10 * 1024 * 1024,
+        content_types=frozenset({
+            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            "application/vnd.ms-excel",
+        }),
+        extensions=frozenset({".xlsx", ".xls"}),
+        default_extension=".xlsx",
+        allow_generic=True,
+    ),
+    "font": UploadLimits(
+        max_bytes=5 * 1024 * 1024,
+        content_types=frozenset({
+            "font/ttf", "font/otf", "font/sfnt",
+            "application/x-font-ttf", "application/x-font-otf", "application/font-sfnt",
+        }),
+        extensions=frozenset({".ttf", ".otf"}),
+        default_extension=".ttf",
+        allow_generic=True,
+    ),
+}
+
+
+class SpooledUpload:
+    """
+    Archivo subido ya validado, junto a su tamaño y su SHA-256. El contenido
+    es el temporal de Starlette (en memoria si es pequeño, en disco si no),
+    sin copiarlo. Se usa como context manager para liberar el temporal.
+    """
+    def __init__(self, spool: BinaryIO, size: int, sha256: str, filename: str, extension: str):
+        self._spool = spool
+        self.size = size
+        self.sha256 = sha256
+        self.filename = filename
+        self.extension = extension
+
+    def open(self) -> BinaryIO:
+        """Devuelve el contenido, posicionado al principio."""
+        self._spool.seek(0)
+        return self._spool
+
+    def close(self):
+        self._spool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _too_large(kind: str, limits: UploadLimits) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"El archivo ({kind}) supera el tamaño máximo de {limits.max_bytes // (1024 * 1024)} MB."
+    )
+
+
+def upload_file(kind: str, default: Any = ...) -> Any:
+    """
+    Parámetro File(...) de un endpoint, marcado con su tipo de archivo para
+    que UploadLimitRoute conozca el tamaño máximo del cuerpo de la petición.
+    """
+    return File(default, json_schema_extra={_UPLOAD_KIND: kind})
+
+
+class UploadLimitRoute(APIRoute):
+    """
+    Ruta que rechaza con 413 las subidas cuyo Content-Length supera la suma
+    de los límites de sus archivos (marcados con upload_file), antes de que
+    Starlette lea y guarde el cuerpo. Sin Content-Length (chunked) el cuerpo
+    se recibe entero y el límite lo aplica read_upload después.
+    """
+    def max_body_bytes(self) -> Optional[int]:
+        kinds = [
+            (param.field_info.json_schema_extra or {}).get(_UPLOAD_KIND)
+            for param in self.dependant.body_params
+        ]
+        kinds = [kind for kind in kinds if kind]
+        if not kinds:
+            return None
+        return sum(UPLOAD_LIMITS[kind].max_bytes for kind in kinds) + UPLOAD_FORM_OVERHEAD
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        max_bytes = self.max_body_bytes()
+        if max_bytes is None:
+            return handler
+
+        async def limited_handler(request: Request):
+            length = request.headers.get("content-length", "")
+            if length.isdigit() and int(length) > max_bytes:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"La petición supera el tamaño máximo de {max_bytes // (1024 * 1024)} MB."
+                )
+            return await handler(request)
+        return limited_handler
+
+
+def _hash_file(source: BinaryIO, max_bytes: int) -> tuple[int, str]:
+    """
+    Tamaño y SHA-256 del archivo, leído por bloques desde el principio. Deja
+    de leer en cuanto supera 'max_bytes'. Bloqueante: llamar desde un hilo.
+    """
+    source.seek(0)
+    hasher = hashlib.sha256()
+    size = 0
+    while chunk := source.read(UPLOAD_CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_bytes:
+            break
+        hasher.update(chunk)
+    source.seek(0)
+    return size, hasher.hexdigest()
+
+
+async def read_upload(file: UploadFile, kind: str) -> SpooledUpload:
+    """
+    Valida un archivo subido (tipo, extensión y tamaño máximo) y calcula su
+    hash. Starlette ya ha guardado la subida completa en un temporal (en disco
+    si es grande): se lee de ahí en un hilo, sin copiarla ni bloquear el event
+    loop. Este límite llega después de recibir el cuerpo; el rechazo temprano
+    por Content-Length lo hace UploadLimitRoute.
+    """
+    limits = UPLOAD_LIMITS[kind]
+    filename = file.filename or ""
+    extension = os.path.splitext(filename)[1].lower()
+    content_type = (file.content_type or "").split(";")[0].strip().lower()
+
+    valid_type = content_type in limits.content_types or (
+        limits.allow_generic and content_type in ("", _GENERIC_CONTENT_TYPE) and extension in limits.extensions
+    )
+    if not valid_type:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Tipo de archivo no permitido ({content_type or 'desconocido'}). "
+                   f"Extensiones admitidas: {', '.join(sorted(limits.extensions))}."
+        )
+
+    # Si el tamaño ya se conoce, se rechaza sin leer nada
+    if file.size is not None and file.size > limits.max_bytes:
+        raise _too_large(kind, limits)
+
+    size, sha256 = await asyncio.to_thread(_hash_file, file.file, limits.max_bytes)
+    if size > limits.max_bytes:
+        raise _too_large(kind, limits)
+
+    if size == 0:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"El archivo ({kind}) está vacío."
+        )
+
+    if extension not in limits.extensions:
+        extension = limits.default_extension
+    return SpooledUpload(file.file, size, sha256, filename, extension)
@@ -0,0 +1,41 @@
+# gunicorn.conf.py
+#
+#   gunicorn app.main:app -c gunicorn.conf.py
+#   gunicorn app.claim_main:app -c gunicorn.conf.py   (solo reclamación)
+#
+# Las métricas de Prometheus de todos los workers se agregan a través de
+# PROMETHEUS_MULTIPROC_DIR: la variable debe existir antes de que los workers
+# importen prometheus_client, por eso se fija aquí, en el proceso maestro
+# (sin preload_app, los workers cargan la aplicación después de on_starting).
+#
+# Si no se define, se usa un directorio por aplicación y dirección, para que
+# dos servidores en la misma máquina (p. ej. app.main y app.claim_main) no
+# mezclen sus métricas ni borren el directorio del otro al arrancar.
+
+import os
+import re
+import shutil
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+PROMETHEUS_BASE_DIR = "/tmp/certhub-prometheus"
+
+
+def _multiproc_dir(server) -> str:
+    """Directorio de métricas de este servidor: app (proc_name) y direcciones."""
+    name = "_".join([server.cfg.proc_name, *server.cfg.bind])
+    return os.path.join(PROMETHEUS_BASE_DIR, re.sub(r"[^A-Za-z0-9.-]+", "_", name))
+
+
+def on_starting(server):
+    path = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", _multiproc_dir(server))
+    # Los valores de una ejecución anterior no deben sumarse a los nuevos
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)